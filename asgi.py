@@ -0,0 +1,6 @@
+from bitstore.asgi import make_app
+from server import app as wsgi_app
+
+
+# Serve the Flask app of server.py to any ASGI server (e.g. `uvicorn asgi:app`)
+app = make_app(wsgi_app)
@@ -0,0 +1,194 @@
+"""Benchmarks of the authorize, presign and info controllers.
+
+Runs against moto and an in-memory FileManager registry, like the tests, and
+prints the results as JSON so runs can be compared across commits:
+throughput, p50/p99 latency and peak traced memory per scenario.
+
+    python benchmarks/controllers.py [--quick] [--output results.json]
+
+Run from the repository root (the token keys are read from tests/).
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import auth
+import boto3
+import jwt
+import requests_mock
+from filemanager.models import FileManager
+from moto import mock_s3_deprecated
+
+from bitstore import controllers, tokens
+
+BUCKET = 'buckbuck'
+MD5 = 'BE4Y8L87GawEKKdchUNhlA=='
+
+
+def generate_token(owner='owner'):
+    private_key = open('tests/private.pem').read()
+    return jwt.encode({
+        'userid': owner,
+        'permissions': {
+            'max_dataset_num': 10,
+            'max_private_storage_mb': 1000000,
+            'max_public_storage_mb': 1000000
+        },
+        'service': 'source'
+    }, private_key, algorithm='RS256').decode('ascii')
+
+
+def make_payload(count):
+    return {
+        'metadata': {'owner': 'owner', 'dataset': 'name'},
+        'filedata': dict(
+            ('data/dir%d/file%d.csv' % (i % 100, i),
+             {'name': 'file%d.csv' % i, 'length': 100, 'md5': MD5, 'type': 'text/csv'})
+            for i in range(count)
+        )
+    }
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(func, iterations, concurrency=1):
+    """Call `func(i)` `iterations` times from `concurrency` threads.
+
+    Peak memory is traced over one extra call, as tracing slows down the
+    timed ones.
+    """
+    func(-1)
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(iterations))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            func(i)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'ops_per_sec': round(iterations / wall, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_memory_bytes': peak,
+    }
+
+
+def check(response):
+    if not isinstance(response, str):
+        raise RuntimeError('Unexpected response: %s' % response.status)
+    return response
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    controllers.reset_state()
+    controllers.config.update({
+        'STORAGE_BUCKET_NAME': BUCKET,
+        'STORAGE_ACCESS_KEY_ID': '',
+        'STORAGE_SECRET_ACCESS_KEY': '',
+        'STORAGE_PATH_PATTERN': '{owner}/{dataset}/{path}',
+    })
+    token = generate_token()
+    verifyer = tokens.CachingVerifyer(
+        auth.lib.Verifyer(public_key=open('tests/public.pem').read()))
+    registry = FileManager('sqlite://')
+    registry.init_db()
+    boto3.client('s3').create_bucket(Bucket=BUCKET)
+
+    results = {}
+    for count, iterations in [(1, 500), (100, 50), (10000, 3)]:
+        payload = make_payload(count)
+        results['authorize_%d' % count] = measure(
+            lambda i: check(controllers.authorize(token, payload, verifyer, registry)),
+            max(1, iterations // scale))
+
+    with requests_mock.Mocker(real_http=False) as mocker:
+        mocker.head(re.compile('http://public.example.com/'), status_code=200)
+        mocker.head(re.compile('http://%s/' % BUCKET), status_code=403)
+        results['presign_public'] = measure(
+            lambda i: check(controllers.presign(
+                token, 'http://public.example.com/owner/file%d.csv' % i, verifyer, 'owner')),
+            1000 // scale)
+        results['presign_private'] = measure(
+            lambda i: check(controllers.presign(
+                token, 'http://%s/owner/name/file%d.csv' % (BUCKET, i), verifyer, 'owner')),
+            1000 // scale)
+
+    for concurrency in (1, 8):
+        results['info_concurrency_%d' % concurrency] = measure(
+            lambda i: controllers.info_response(token, verifyer),
+            5000 // scale, concurrency=concurrency)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='run 10x fewer iterations')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args(argv)
+
+    with mock_s3_deprecated():
+        results = run(args.quick)
+    report = {
+        'commit': git_commit(),
+        'date': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'python': platform.python_version(),
+        'signer': controllers.config.get('STORAGE_SIGNER', 'boto3'),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
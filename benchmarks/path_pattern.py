@@ -0,0 +1,70 @@
+"""Micro-benchmark of the compiled STORAGE_PATH_PATTERN formatter.
+
+Compares `bitstore.paths` with the previous `format_s3_path`, which copied
+the file info and computed every field for each path.
+
+    python benchmarks/path_pattern.py [count]
+"""
+import base64
+import codecs
+import os
+import sys
+import timeit
+
+from bitstore import paths
+
+PATTERNS = ['{owner}/{dataset}/{path}', '{md5_hex}{extension}']
+
+
+def legacy_format_s3_path(pattern, file, owner, dataset_name, path):
+    format_params = dict(file)
+    format_params.update({
+        'owner': owner,
+        'dataset': dataset_name,
+        'path': path,
+        'basename': os.path.basename(path),
+        'dirname': os.path.dirname(path),
+        'extension': os.path.splitext(path)[1],
+    })
+    if 'md5' in format_params:
+        try:
+            md5 = base64.b64decode(format_params['md5'])
+            format_params['md5_hex'] = codecs.encode(md5, 'hex').decode('ascii')
+        except Exception:
+            pass
+
+    try:
+        s3path = pattern.format(**format_params)
+    except KeyError as e:
+        msg = ('STORAGE_PATH_PATTERN contains variable not found in file info: %s' % e)
+        raise ValueError(msg)
+
+    return s3path
+
+
+def main(count=100000):
+    files = [('data/dir%d/file%d.csv' % (i % 100, i),
+              {'length': i, 'md5': 'BE4Y8L87GawEKKdchUNhlA==', 'type': 'text/csv'})
+             for i in range(count)]
+    for pattern in PATTERNS:
+        compiled = paths.compile_pattern(pattern)
+        for path, file in files[:100]:
+            assert compiled.format(file, 'owner', 'name', path) == \
+                legacy_format_s3_path(pattern, file, 'owner', 'name', path)
+
+        def legacy():
+            for path, file in files:
+                legacy_format_s3_path(pattern, file, 'owner', 'name', path)
+
+        def fast():
+            for path, file in files:
+                compiled.format(file, 'owner', 'name', path)
+
+        legacy_time = min(timeit.repeat(legacy, number=1, repeat=3))
+        fast_time = min(timeit.repeat(fast, number=1, repeat=3))
+        print('%-28s %d paths: legacy %.3fs, compiled %.3fs (x%.1f)' % (
+            pattern, count, legacy_time, fast_time, legacy_time / fast_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
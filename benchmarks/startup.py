@@ -0,0 +1,68 @@
+"""Measures the startup time of the service, in a fresh interpreter.
+
+Reports as JSON the time to import `server`, to the first served request and
+until `/ready` reports the services warm. Storage and database are local
+(unreachable S3 is not contacted at startup, the registry is in-memory
+SQLite) and the auth key refresh is off, so nothing waits on the network.
+
+    python benchmarks/startup.py [--runs 5]
+
+Run from the repository root.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD = r'''
+import json, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+client = server.app.test_client()
+status = client.get('/rawstore/info').status_code
+first_request = time.perf_counter()
+while client.get('/rawstore/ready').status_code != 200:
+    time.sleep(0.001)
+ready = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - start,
+    'first_request_seconds': first_request - start,
+    'first_request_status': status,
+    'ready_seconds': ready - start,
+}))
+'''
+
+
+def run_once(env):
+    output = subprocess.check_output([sys.executable, '-c', CHILD], env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': 'sqlite://',
+        'AUTH_SERVER': 'http://127.0.0.1:9',
+        'AUTH_PUBLIC_KEY_REFRESH_INTERVAL': '0',
+        'STORAGE_BUCKET_NAME': 'buckbuck',
+        'STORAGE_ACCESS_KEY_ID': 'x',
+        'STORAGE_SECRET_ACCESS_KEY': 'y',
+        'STORAGE_PATH_PATTERN': '{owner}/{dataset}/{path}',
+        'AWS_DEFAULT_REGION': env.get('AWS_DEFAULT_REGION', 'us-east-1'),
+    })
+    env.setdefault('INIT_MODE', 'background')
+    runs = [run_once(env) for _ in range(args.runs)]
+    report = {'init_mode': env['INIT_MODE'], 'runs': runs}
+    for name in ('import_seconds', 'first_request_seconds', 'ready_seconds'):
+        report[name] = round(sorted(run[name] for run in runs)[len(runs) // 2], 4)
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
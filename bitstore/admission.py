@@ -0,0 +1,169 @@
+import collections
+import math
+import threading
+import time
+
+from . import metrics
+
+
+class Throttled(Exception):
+    """Raised when a request is not admitted.
+    """
+
+    def __init__(self, endpoint, reason, retry_after):
+        super(Throttled, self).__init__(
+            '%s: %s limit exceeded, retry after %.1fs' % (endpoint, reason, retry_after))
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Policy(object):
+    """Per-owner limits of an endpoint.
+
+    :param rate: cost units refilled per second, 0 for no rate limit
+    :param burst: size of the token bucket (defaults to one second of rate)
+    :param max_concurrent: max requests in progress, 0 for no cap
+    """
+
+    def __init__(self, rate=0, burst=None, max_concurrent=0):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.max_concurrent = max_concurrent
+
+
+class _State(object):
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.active = 0
+
+
+class Ticket(object):
+    """An admitted request, holding a concurrency slot until released.
+    """
+
+    def __init__(self, release=None):
+        self._release = release
+        self._deferred = False
+
+    def defer(self, response):
+        """Keep the slot until a (streamed) response is closed.
+        """
+        if self._release is not None:
+            self._deferred = True
+            response.call_on_close(self._release_now)
+        return response
+
+    def release(self):
+        if not self._deferred:
+            self._release_now()
+
+    def _release_now(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+_UNLIMITED = Ticket()
+
+
+class AdmissionControl(object):
+    """Token-bucket rate limits and concurrency caps per owner and endpoint.
+
+    A request costs a number of units (e.g. its number of files), taken from
+    the owner's bucket for the endpoint. When the bucket is short, or the
+    owner already has `max_concurrent` requests in progress, the request is
+    rejected right away with the delay after which it may succeed, rather
+    than queued. Costs above the bucket size are capped to it, so a large
+    request waits for a full bucket instead of never fitting.
+    """
+
+    def __init__(self, policies=None, max_owners=10000, clock=time.monotonic):
+        self.policies = dict(policies or {})
+        self.max_owners = max_owners
+        self.clock = clock
+        self.stats = metrics.Counters()
+        self._states = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def applies(self, endpoint):
+        return endpoint in self.policies
+
+    def admit(self, endpoint, owner, cost=1):
+        """Admit a request or raise Throttled.
+        :return: a Ticket to release when the request is done
+        """
+        policy = self.policies.get(endpoint)
+        if policy is None:
+            return _UNLIMITED
+        if policy.rate > 0:
+            cost = min(max(cost, 1), policy.burst)
+        key = (endpoint, owner)
+        with self._lock:
+            now = self.clock()
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _State(policy.burst, now)
+                self._evict()
+            else:
+                self._states.move_to_end(key)
+            if policy.rate > 0:
+                state.tokens = min(policy.burst,
+                                   state.tokens + (now - state.updated) * policy.rate)
+                state.updated = now
+            if policy.max_concurrent and state.active >= policy.max_concurrent:
+                error = Throttled(endpoint, 'concurrency', 1)
+            elif policy.rate > 0 and state.tokens < cost:
+                error = Throttled(endpoint, 'rate', (cost - state.tokens) / policy.rate)
+            else:
+                error = None
+                state.tokens -= cost if policy.rate > 0 else 0
+                state.active += 1
+        if error is not None:
+            self.stats.inc(endpoint + '.throttled')
+            self.stats.inc(endpoint + '.throttled_cost', cost)
+            raise error
+        self.stats.inc(endpoint + '.admitted')
+        self.stats.inc(endpoint + '.admitted_cost', cost)
+        return Ticket(lambda: self._release(key, state))
+
+    def _release(self, key, state):
+        with self._lock:
+            state.active -= 1
+
+    def _evict(self):
+        # Forget the least recently seen owners, unless they have requests
+        # in progress
+        while len(self._states) > self.max_owners:
+            key, state = next(iter(self._states.items()))
+            if state.active:
+                return
+            del self._states[key]
+
+    def reset(self):
+        self.stats.reset()
+        with self._lock:
+            self._states.clear()
+
+
+def retry_after_header(error):
+    """Format the delay of a Throttled error as a Retry-After value.
+    """
+    return str(max(1, int(math.ceil(error.retry_after))))
+
+
+def policies_from_config(config, endpoints):
+    """Read the ADMISSION_<ENDPOINT>_RATE, _BURST and _CONCURRENCY settings.
+    """
+    policies = {}
+    for endpoint in endpoints:
+        prefix = 'ADMISSION_%s_' % endpoint.upper()
+        rate = float(config.get(prefix + 'RATE', 0))
+        burst = config.get(prefix + 'BURST')
+        max_concurrent = int(config.get(prefix + 'CONCURRENCY', 0))
+        if rate > 0 or max_concurrent > 0:
+            policies[endpoint] = Policy(
+                rate, float(burst) if burst is not None else None, max_concurrent)
+    return policies
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+class App(object):
+    """ASGI adapter serving a WSGI application, e.g. the Flask app of server.py.
+
+    The event loop accepts connections, reads request bodies and writes
+    responses, while the WSGI application runs on a bounded thread pool, as
+    does the iteration of streamed responses, one chunk at a time.
+    Concurrency is thus capped by `max_threads`, as with threaded workers;
+    the loop only keeps slow clients from holding a thread while their bodies
+    are transferred. At most `max_pending` requests are accepted at a time,
+    the others get a 503.
+
+    Routing, CORS and error responses are left to the WSGI application.
+    """
+
+    def __init__(self, wsgi_app, max_threads=64, max_body_bytes=64 * 1024 * 1024,
+                 max_pending=256):
+        self.wsgi_app = wsgi_app
+        self.max_body_bytes = max_body_bytes
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_threads,
+                                           thread_name_prefix='bitstore-asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if self.pending >= self.max_pending:
+            await send_simple(send, 503, b'Too many requests in progress', [(b'retry-after', b'1')])
+            return
+
+        self.pending += 1
+        try:
+            await self.handle(scope, receive, send)
+        finally:
+            self.pending -= 1
+
+    async def handle(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        try:
+            if not await self.read_body(receive, body):
+                await send_simple(
+                    send, 413, ('Request body exceeds %d bytes' % self.max_body_bytes).encode())
+                return
+            body.seek(0)
+            loop = asyncio.get_event_loop()
+            try:
+                status, headers, result, iterator, chunks = await loop.run_in_executor(
+                    self.executor, self.call, wsgi_environ(scope, body))
+            except Exception: # noqa
+                logging.exception('Internal error (%s)', scope['path'])
+                await send_simple(send, 500, b'')
+                return
+            try:
+                await send({
+                    'type': 'http.response.start',
+                    'status': int(status.split(' ', 1)[0]),
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in headers],
+                })
+                for chunk in chunks:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                while True:
+                    chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+                    if chunk is None:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                # Streamed responses release their resources when closed
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    await loop.run_in_executor(self.executor, close)
+        finally:
+            body.close()
+
+    def call(self, environ):
+        """Run the WSGI application up to the start of its response.
+        :return: tuple of (status, headers, response, its iterator, chunks already read)
+        """
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        result = self.wsgi_app(environ, start_response)
+        iterator = iter(result)
+        chunks = []
+        # The application may only start its response with the first chunk
+        while not started:
+            chunk = next(iterator, None)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        return started[0], started[1], result, iterator, [chunk for chunk in chunks if chunk]
+
+    async def read_body(self, receive, body):
+        """Copy the request body to a file, returning False if it is too large.
+        """
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return True
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return False
+            body.write(chunk)
+            if not message.get('more_body'):
+                return True
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def wsgi_environ(scope, body):
+    """Make the WSGI environ of an ASGI HTTP request.
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The body is read in full, so it can be read to its end without Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+async def send_simple(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def make_app(wsgi_app):
+    """Serve a WSGI application over ASGI, sized by the ASGI_* settings.
+    """
+    max_threads = int(os.environ.get('ASGI_THREADS', 64))
+    return App(wsgi_app,
+               max_threads=max_threads,
+               max_body_bytes=int(os.environ.get('AUTHORIZE_MAX_BODY_BYTES', 64 * 1024 * 1024)),
+               max_pending=int(os.environ.get('ASGI_MAX_PENDING', max_threads * 4)))
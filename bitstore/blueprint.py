@@ -1,49 +1,270 @@
+import functools
 import json
+import logging
 import os
+import threading
+import time
 
 from flask import Blueprint, request, Response
 
 from auth.lib import Verifyer
 from filemanager.models import FileManager
-from . import controllers
+from . import controllers, ingest, paths, tokens
 
 db_connection_string = os.environ.get('DATABASE_URL')
 auth_server = os.environ.get('AUTH_SERVER')
 
+# Services of the blueprints created in this process
+_services = []
 
-def make_blueprint():
-    """Create blueprint.
+
+def make_verifyer():
+    """Create the token verifyer, caching permissions and refreshing the auth
+    server's public key in the background.
     """
+    auth_endpoint = f'{auth_server}/auth/public-key'
+    verifyer = tokens.CachingVerifyer(
+        Verifyer(auth_endpoint=auth_endpoint),
+        auth_endpoint=auth_endpoint,
+        maxsize=int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000)),
+        ttl=float(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+    )
+    key_refresh_interval = float(os.environ.get('AUTH_PUBLIC_KEY_REFRESH_INTERVAL', 3600))
+    if key_refresh_interval > 0:
+        verifyer.start_background_refresh(key_refresh_interval)
+    return verifyer
 
-    verifyer = Verifyer(auth_endpoint=f'{auth_server}/auth/public-key')
 
-    # Create FileManager tables if not exists
+def make_file_manager():
+    """Create the file registry, and its tables if not exists.
+    """
     file_manager = FileManager(db_connection_string)
     file_manager.init_db()
+    return file_manager
 
-    # Create instance
-    blueprint = Blueprint('bitstore', 'bitstore')
 
-    # Controller proxies
+def init_storage():
+    """Validate the storage settings and warm the storage client and caches.
+    """
+    # Reject an invalid STORAGE_PATH_PATTERN at startup
+    paths.compile_pattern(controllers.config['STORAGE_PATH_PATTERN'])
+
+    # Precompute the /info prefixes (rejecting an invalid STORAGE_SHARDS)
+    controllers.info_templates(controllers.storage_buckets())
+
+    # Create the pooled S3 clients (and bootstrap the buckets) once at startup
+    s3 = controllers.get_s3_client()
+    ring = controllers.get_ring()
+    for shard in ring.shards if ring is not None else []:
+        controllers.get_shard_client(shard)
+    if controllers.is_enabled('EXISTENCE_INDEX'):
+        controllers.start_existence_index(s3)
+
+
+class Services(object):
+    """The token verifyer, file registry and storage used by a blueprint.
+
+    They are initialised on first use in each process: on a background
+    thread by default, so a slow or down dependency delays readiness instead
+    of failing the boot, with each step retried until it succeeds.
+    `INIT_MODE=blocking` initialises them synchronously instead, raising on
+    failure, and `INIT_MODE=lazy` defers them to the first request (or
+    `start_services`, e.g. after forking workers).
+    """
+
+    def __init__(self):
+        self.verifyer = None
+        self.file_manager = None
+        self.storage_ready = False
+        self.ready = threading.Event()
+        self.created_at = time.monotonic()
+        self.ready_after = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, background=True):
+        """Start initialising the services, once per process.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process which started them: its threads,
+                # connections and pools are not usable here
+                self.verifyer = self.file_manager = None
+                self.storage_ready = False
+                controllers.reset_state()
+            self._pid = os.getpid()
+            self.ready.clear()
+        if background:
+            threading.Thread(target=self.initialise, name='bitstore-init', daemon=True).start()
+        else:
+            self.initialise(retry=False)
+
+    def initialise(self, retry=True):
+        delay = 1
+        for name, step in [('auth', self._init_auth),
+                           ('database', self._init_database),
+                           ('storage', self._init_storage)]:
+            while True:
+                try:
+                    step()
+                    break
+                except Exception: # noqa
+                    if not retry:
+                        raise
+                    logging.exception('Failed to initialise %s, retrying in %ds', name, delay)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 60)
+        self.ready_after = time.monotonic() - self.created_at
+        self.ready.set()
+        logging.info('Services ready after %.3fs', self.ready_after)
+
+    def _init_auth(self):
+        if self.verifyer is None:
+            self.verifyer = make_verifyer()
+
+    def _init_database(self):
+        if self.file_manager is None:
+            self.file_manager = make_file_manager()
+
+    def _init_storage(self):
+        init_storage()
+        self.storage_ready = True
+
+    def wait(self, timeout):
+        """Start the services if needed and wait up to `timeout` seconds for them.
+        """
+        if self._pid != os.getpid():
+            self.start(os.environ.get('INIT_MODE', 'background') != 'blocking')
+        return self.ready.wait(timeout)
+
+    def status(self):
+        verifyer = self.verifyer
+        refreshed = float(os.environ.get('AUTH_PUBLIC_KEY_REFRESH_INTERVAL', 3600)) <= 0 or \
+            (verifyer is not None and verifyer.public_key is not None)
+        components = {
+            'auth': verifyer is not None and refreshed,
+            'database': self.file_manager is not None,
+            'storage': self.storage_ready,
+        }
+        return {
+            'ready': self.ready.is_set() and all(components.values()),
+            'components': components,
+            'ready_after': self.ready_after,
+        }
+
+
+def start_services():
+    """Start initialising the services of every blueprint in this process.
+    """
+    for services in _services:
+        services.start(os.environ.get('INIT_MODE', 'background') != 'blocking')
+
+
+def get_auth_token():
+    """Read the token from the Auth-Token header or the jwt parameter.
+    """
+    return request.headers.get('Auth-Token') or request.values.get('jwt')
+
+
+def services_required(services, timeout):
+    """Make a decorator answering 503 until the services are initialised.
+    """
+    def needs_services(proxy):
+        @functools.wraps(proxy)
+        def wrapper():
+            if not services.wait(timeout):
+                return Response('Service is starting', status=503, headers={'Retry-After': '1'})
+            return proxy()
+        return wrapper
+    return needs_services
+
+
+def authorize_proxy(services):
+    """Make the proxy of authorize, reading the manifest from the request stream.
+    """
     def authorize():
-        auth_token = request.headers.get('auth-token') or request.values.get('jwt')
+        try:
+            req_payload = ingest.read_manifest(
+                request.stream,
+                max_bytes=int(os.environ.get('AUTHORIZE_MAX_BODY_BYTES', 64 * 1024 * 1024)),
+                max_files=int(os.environ.get('AUTHORIZE_MAX_FILES', 100000)),
+                content_length=request.content_length)
+            return controllers.authorize(
+                get_auth_token(), req_payload, services.verifyer, services.file_manager)
+        except ingest.ManifestTooLarge as e:
+            return Response(str(e), status=413)
+        except (json.JSONDecodeError, ValueError) as e:
+            return Response(str(e), status=400)
+    return authorize
+
+
+def json_proxy(controller, services):
+    """Make the proxy of a controller taking a JSON request body.
+    """
+    def proxy():
         try:
             req_payload = json.loads(request.data.decode())
-            return controllers.authorize(auth_token, req_payload, verifyer, file_manager)
+            return controller(get_auth_token(), req_payload, services.verifyer)
         except (json.JSONDecodeError, ValueError) as e:
             return Response(str(e), status=400)
+    proxy.__name__ = controller.__name__
+    return proxy
 
+
+def make_blueprint():
+    """Create blueprint.
+    """
+
+    # Reject an invalid STORAGE_PATH_PATTERN at startup
+    paths.compile_pattern(controllers.config['STORAGE_PATH_PATTERN'])
+
+    services = Services()
+    _services.append(services)
+    init_mode = os.environ.get('INIT_MODE', 'background')
+    if init_mode != 'lazy':
+        services.start(background=init_mode != 'blocking')
+    wait_timeout = float(os.environ.get('INIT_WAIT_TIMEOUT', 10))
+
+    # Create instance
+    blueprint = Blueprint('bitstore', 'bitstore')
+
+    needs_services = services_required(services, wait_timeout)
+
+    # Controller proxies
+    authorize = needs_services(authorize_proxy(services))
+
+    @needs_services
     def info():
-        auth_token = request.headers.get('Auth-Token')
-        if auth_token is None:
-            auth_token = request.values.get('jwt')
-        return controllers.info(auth_token, verifyer)
+        return controllers.info_response(
+            get_auth_token(), services.verifyer, request.headers.get('If-None-Match'))
 
+    @needs_services
     def presign():
-        auth_token = request.headers.get('Auth-Token') or request.values.get('jwt')
-        url = request.values.get('url')
-        ownerid = request.values.get('ownerid')
-        return controllers.presign(auth_token, url, verifyer, ownerid)
+        return controllers.presign(
+            get_auth_token(), request.values.get('url'), services.verifyer,
+            request.values.get('ownerid'))
+
+    @needs_services
+    def dataset_manifest():
+        return controllers.dataset_manifest(
+            get_auth_token(), request.values.get('owner'), request.values.get('dataset'),
+            services.verifyer)
+
+    presign_bulk = needs_services(json_proxy(controllers.presign_bulk, services))
+    complete_multipart = needs_services(json_proxy(controllers.complete_multipart, services))
+    abort_multipart = needs_services(json_proxy(controllers.abort_multipart, services))
+
+    @needs_services
+    def metrics():
+        return Response(controllers.metrics_text({'auth_token': services.verifyer.cache}),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def ready():
+        status = services.status()
+        return Response(json.dumps(status), status=200 if status['ready'] else 503,
+                        mimetype='application/json')
 
     # Register routes
     blueprint.add_url_rule(
@@ -52,6 +273,18 @@ def make_blueprint():
             'authorize', 'authorize', authorize, methods=['POST'])
     blueprint.add_url_rule(
             'presign', 'presign', presign, methods=['GET'])
+    blueprint.add_url_rule(
+            'dataset/manifest', 'dataset_manifest', dataset_manifest, methods=['GET'])
+    blueprint.add_url_rule(
+            'presign/bulk', 'presign_bulk', presign_bulk, methods=['POST'])
+    blueprint.add_url_rule(
+            'multipart/complete', 'complete_multipart', complete_multipart, methods=['POST'])
+    blueprint.add_url_rule(
+            'multipart/abort', 'abort_multipart', abort_multipart, methods=['POST'])
+    blueprint.add_url_rule(
+            'metrics', 'metrics', metrics, methods=['GET'])
+    blueprint.add_url_rule(
+            'ready', 'ready', ready, methods=['GET'])
     blueprint.add_url_rule(
             '/', 'authorize', authorize, methods=['POST'])
 
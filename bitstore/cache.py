@@ -0,0 +1,62 @@
+import collections
+import threading
+import time
+
+
+class LRUCache(object):
+    """Thread-safe, size-bounded LRU cache with per-entry expiry.
+
+    Entries are stored with an absolute deadline (on the `time.monotonic`
+    clock) and are never served past it. Hits and misses are counted for
+    monitoring.
+    """
+
+    def __init__(self, maxsize, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > self.clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl):
+        """Store a value for `ttl` seconds.
+        """
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self.clock() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None, predicate=None):
+        """Drop one entry, the entries matching `predicate(key)`, or everything.
+        """
+        with self._lock:
+            if key is not None:
+                self._data.pop(key, None)
+            elif predicate is not None:
+                for k in [k for k in self._data if predicate(k)]:
+                    del self._data[k]
+            else:
+                self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
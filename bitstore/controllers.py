@@ -1,9 +1,11 @@
 import base64
-import codecs
+import functools
+import hashlib
+import itertools
 import json
 import logging
 import os
-import requests
+import threading
 import urllib
 
 
@@ -12,75 +14,676 @@ try:
 except ImportError:
     from urlparse import urlparse, parse_qs
 
-import boto3
-import botocore
-from boto3.exceptions import Boto3Error
-from botocore.client import Config
-from flask import request, Response
+from flask import has_request_context, request, Response
+from werkzeug.http import parse_etags
 
 import auth
 from filemanager.models import FileManager
 
+from . import admission, cache, existence, index, metrics, multipart, parallel, paths, probe, shards, \
+    singleflight, storage, usage
+
 config = {}
 for key, value in os.environ.items():
     config[key.upper()] = value
 
+PRESIGN_EXPIRES_IN = 3600*24
+ALL_USERS = 'http://acs.amazonaws.com/groups/global/AllUsers'
+
+# Signed download URLs, keyed by (bucket, key, owner)
+presign_cache = cache.LRUCache(int(config.get('PRESIGN_CACHE_SIZE', 1024)))
+
+# Pooled, cached HEAD probing of URLs to presign
+prober = probe.Prober(
+    timeout=float(config.get('PRESIGN_PROBE_TIMEOUT', 5)),
+    cache_size=int(config.get('PRESIGN_PROBE_CACHE_SIZE', 4096)),
+    public_ttl=float(config.get('PRESIGN_PROBE_PUBLIC_TTL', 300)),
+    private_ttl=float(config.get('PRESIGN_PROBE_PRIVATE_TTL', 3600)),
+    pool_size=int(config.get('PRESIGN_PROBE_POOL_SIZE', 10))
+)
+
+# Per-owner storage totals used for quota checks
+usage_cache = usage.UsageCache(ttl=float(config.get('USAGE_CACHE_TTL', 30)))
+
+# Files authorize found already stored with the same content
+dedup_stats = metrics.Counters()
+
+# Per-stage latency histograms and S3 call counters
+recorder = metrics.Recorder(
+    enabled=config.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes', 'on'),
+    sample_rate=float(config.get('METRICS_LOG_SAMPLE_RATE', 0)))
+
+# Per-owner rate limits and concurrency caps of the expensive endpoints
+admission_control = admission.AdmissionControl(admission.policies_from_config(
+    config, ['authorize', 'presign', 'presign_bulk', 'dataset_manifest']))
+
+# Concurrent identical probes, existence checks and signatures run once
+flights = singleflight.SingleFlight()
+
+# Bloom filter of the stored keys, set up by start_existence_index
+existence_index = None
+
+# Worker pools by name, see get_pool
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def is_enabled(name):
+    """Check a boolean config flag.
+    """
+    return config.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
 
 def get_s3_client():
-    endpoint_url = os.environ.get("S3_ENDPOINT_URL")
-    s3_client = boto3.client('s3',
-                             # region_name='us-east-1',
-                             aws_access_key_id=config['STORAGE_ACCESS_KEY_ID'],
-                             config=Config(signature_version='s3v4', s3={'addressing_style': 'path'}),
-                             aws_secret_access_key=config['STORAGE_SECRET_ACCESS_KEY'],
-                             endpoint_url=endpoint_url
-                             )
-    if endpoint_url:
-        try:
-            s3 = boto3.resource('s3',
-                                 aws_access_key_id=config['STORAGE_ACCESS_KEY_ID'],
-                                 config=Config(signature_version='s3v4'),
-                                 aws_secret_access_key=config['STORAGE_SECRET_ACCESS_KEY'],
-                                 endpoint_url=endpoint_url)
-            s3.create_bucket(Bucket=config['STORAGE_BUCKET_NAME'])
-            bucket = s3.Bucket(config['STORAGE_BUCKET_NAME'])
-            bucket.Acl().put(ACL='public-read')
-        except: # noqa
-            logging.exception('Failed to create the bucket')
-            pass
-    return s3_client
+    """Return the pooled S3 client for the configured storage.
+    """
+    return storage.get_client(
+        config['STORAGE_ACCESS_KEY_ID'],
+        config['STORAGE_SECRET_ACCESS_KEY'],
+        config['STORAGE_BUCKET_NAME'],
+        endpoint_url=os.environ.get("S3_ENDPOINT_URL"),
+        max_pool_connections=int(config.get('STORAGE_MAX_POOL_CONNECTIONS', 10)),
+        instrument=recorder.instrument_client
+    )
+
+
+def get_ring():
+    """Return the hash ring of the STORAGE_SHARDS buckets, or None if storage
+    is not sharded.
+    """
+    return shards.get_ring(config.get('STORAGE_SHARDS', ''),
+                           int(config.get('STORAGE_SHARD_VNODES', 64)))
+
+
+def get_shard_client(shard):
+    """Return the pooled S3 client of a shard.
+    """
+    return storage.get_client(
+        config['STORAGE_ACCESS_KEY_ID'],
+        config['STORAGE_SECRET_ACCESS_KEY'],
+        shard.bucket,
+        endpoint_url=shard.endpoint_url or os.environ.get("S3_ENDPOINT_URL"),
+        max_pool_connections=int(config.get('STORAGE_MAX_POOL_CONNECTIONS', 10)),
+        instrument=recorder.instrument_client
+    )
+
+
+def storage_buckets():
+    """Return all the buckets files are stored in: STORAGE_BUCKET_NAME, which
+    keeps the files written before sharding, followed by the shards.
+    """
+    buckets = [config['STORAGE_BUCKET_NAME']]
+    ring = get_ring()
+    if ring is not None:
+        buckets.extend(shard.bucket for shard in ring.shards if shard.bucket not in buckets)
+    return tuple(buckets)
+
+
+def get_bucket_client(bucket):
+    """Return the client of one of our buckets.
+    """
+    ring = get_ring()
+    if ring is not None:
+        for shard in ring.shards:
+            if shard.bucket == bucket:
+                return get_shard_client(shard)
+    return get_s3_client()
+
+
+def locate_key(key):
+    """Return the (client, bucket) a key is written to: its shard, or the
+    storage bucket if storage is not sharded.
+    """
+    ring = get_ring()
+    if ring is None:
+        return get_s3_client(), config['STORAGE_BUCKET_NAME']
+    shard = ring.get(key)
+    return get_shard_client(shard), shard.bucket
+
+
+def legacy_lookup_enabled():
+    """Whether keys missing from their shard are looked up in STORAGE_BUCKET_NAME.
+    """
+    return config.get('STORAGE_SHARDS_LEGACY_LOOKUP', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+
+def get_signer(s3):
+    """Return the presigner selected by STORAGE_SIGNER for the given client.
+
+    `boto3` (the default) signs with the client itself, `native` uses the
+    lightweight SigV4 signer which produces identical signatures faster.
+    """
+    if config.get('STORAGE_SIGNER', 'boto3') == 'native':
+        return storage.get_signer(s3)
+    return s3
+
+
+def get_pool(name, workers):
+    """Return the process-wide worker pool `name` of `workers` threads, or
+    None if it has fewer than 2.
+    """
+    if workers < 2:
+        return None
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None or pool.max_workers != workers:
+            pool = _pools[name] = parallel.WorkerPool(workers)
+        return pool
+
+
+def get_worker_pool():
+    """Return the shared worker pool, or None if parallel signing is off.
+    """
+    return get_pool('signing', int(config.get('AUTHORIZE_SIGNING_WORKERS', 0)))
+
+
+def get_presign_pool():
+    """Return the pool probing and signing /presign/bulk URLs, or None if off.
+    """
+    return get_pool('presign', int(config.get('PRESIGN_BULK_POOL_SIZE', 32)))
+
+
+def reset_state():
+    """Drop process-wide clients and caches (used by tests and after a fork).
+    """
+    global existence_index
+    storage.reset()
+    presign_cache.invalidate()
+    prober.cache.invalidate()
+    usage_cache.invalidate()
+    dedup_stats.reset()
+    flights.reset()
+    recorder.reset()
+    admission_control.reset()
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+    if existence_index is not None:
+        existence_index.stop()
+        existence_index = None
+
+
+def start_existence_index(s3):
+    """Build the existence index of the storage bucket and keep it in sync.
+
+    The index is loaded from EXISTENCE_INDEX_SNAPSHOT if that file exists,
+    otherwise warmed from a full listing of the bucket (and the snapshot
+    written). It is then rebuilt every EXISTENCE_INDEX_RESYNC_INTERVAL seconds
+    (right away if the snapshot is older), the processes sharing the snapshot
+    listing the bucket only once between them. If the initial listing fails,
+    the resync loop retries it every EXISTENCE_INDEX_RETRY_INTERVAL seconds,
+    the index letting every key through until then.
+    """
+    global existence_index
+    bucket = config['STORAGE_BUCKET_NAME']
+    snapshot_path = config.get('EXISTENCE_INDEX_SNAPSHOT')
+    interval = float(config.get('EXISTENCE_INDEX_RESYNC_INTERVAL', 3600))
+    new_index = index.ExistenceIndex(
+        capacity=int(config.get('EXISTENCE_INDEX_CAPACITY', 1000000)),
+        error_rate=float(config.get('EXISTENCE_INDEX_ERROR_RATE', 0.01)),
+        snapshot_path=snapshot_path)
+    try:
+        if snapshot_path and os.path.exists(snapshot_path):
+            new_index.load()
+        else:
+            new_index.refresh(s3, bucket, interval)
+    except Exception: # noqa
+        if interval <= 0:
+            raise
+        logging.exception('Failed to build the existence index, retrying in the background')
+    if interval > 0:
+        new_index.start_resync(
+            s3, bucket, interval,
+            retry_interval=float(config.get('EXISTENCE_INDEX_RETRY_INTERVAL', 60)))
+    if existence_index is not None:
+        existence_index.stop()
+    existence_index = new_index
+    logging.info('Existence index started: %s', existence_index.stats())
+    return existence_index
+
+
+def report_stored_keys(keys):
+    """Record keys newly written to the storage bucket in the existence index.
+    """
+    if existence_index is not None:
+        existence_index.add_keys(keys)
+
+
+def find_existing(s3, bucket, keys):
+    """Look up which keys are stored, skipping S3 for those the existence
+    index knows are absent.
+    :return: dict mapping each key to {'ETag', 'Size'} or None if missing
+    """
+    keys = list(keys)
+    maybe = keys
+    # The index only covers STORAGE_BUCKET_NAME
+    use_index = existence_index is not None and bucket == config['STORAGE_BUCKET_NAME']
+    if use_index:
+        existence_index.catch_up()
+        maybe = [key for key in keys if existence_index.might_exist(key)]
+    found = dict.fromkeys(keys)
+    if maybe:
+        found.update(flights.do(
+            'existence', (bucket, tuple(maybe)), existence.resolve,
+            s3, bucket, maybe,
+            max_workers=int(config.get('EXISTENCE_CHECK_WORKERS', 8)),
+            list_threshold=int(config.get('EXISTENCE_LIST_THRESHOLD', 3))
+        ))
+    if use_index and existence_index.ready:
+        existence_index.record(
+            len(maybe), sum(1 for key in maybe if found[key] is not None))
+    return found
+
+
+def find_existing_sharded(keys):
+    """Like find_existing, for keys stored in their shards.
+
+    Keys missing from their shard are looked up in STORAGE_BUCKET_NAME, where
+    they may have been written before sharding.
+    :return: tuple of (dict mapping each key to {'ETag', 'Size'} or None,
+        dict mapping each key to the (client, bucket) it is written to)
+    """
+    locations = dict((key, locate_key(key)) for key in keys)
+    groups = {}
+    for key, (client, bucket) in locations.items():
+        groups.setdefault((client, bucket), []).append(key)
+    found = {}
+    for (client, bucket), group in groups.items():
+        found.update(find_existing(client, bucket, group))
+
+    legacy_bucket = config['STORAGE_BUCKET_NAME']
+    if get_ring() is not None and legacy_lookup_enabled():
+        missing = [key for key, obj in found.items()
+                   if obj is None and locations[key][1] != legacy_bucket]
+        if missing:
+            found.update(
+                (key, obj)
+                for key, obj in find_existing(get_s3_client(), legacy_bucket, missing).items()
+                if obj is not None)
+    return found, locations
+
+
+def metrics_text(caches=None):
+    """Render the latency metrics and the cache, deduplication and existence
+    index statistics in the Prometheus text format.
+    :param caches: extra LRUCaches to report, by name
+    """
+    caches = dict(caches or {}, presign=presign_cache, probe=prober.cache,
+                  usage=usage_cache.cache)
+    samples = []
+    for name, lru in sorted(caches.items()):
+        stats = lru.stats()
+        samples.append(('bitstore_cache_hits_total', 'counter', {'cache': name}, stats['hits']))
+        samples.append(('bitstore_cache_misses_total', 'counter', {'cache': name}, stats['misses']))
+        samples.append(('bitstore_cache_size', 'gauge', {'cache': name}, stats['size']))
+    # Every usage cache miss is a get_total_size_for_owner query
+    samples.append(('bitstore_db_queries_total', 'counter',
+                    {'query': 'get_total_size_for_owner'}, usage_cache.cache.misses))
+    usage_stats = usage_cache.stats()
+    samples.extend([
+        ('bitstore_usage_served_total', 'counter', {}, usage_stats['served']),
+        ('bitstore_usage_served_age_seconds_sum', 'counter', {}, usage_cache.served_age_sum),
+        ('bitstore_usage_served_age_seconds', 'gauge', {'stat': 'avg'},
+         usage_stats['served_age_avg']),
+        ('bitstore_usage_served_age_seconds', 'gauge', {'stat': 'max'},
+         usage_stats['served_age_max']),
+    ])
+    for outcome, value in sorted(flights.stats.snapshot().items()):
+        step, outcome = outcome.rsplit('.', 1)
+        samples.append(('bitstore_singleflight_calls_total', 'counter',
+                        {'step': step, 'outcome': outcome}, value))
+    for step, key, count in flights.saved(int(config.get('METRICS_SINGLEFLIGHT_TOP_KEYS', 10))):
+        samples.append(('bitstore_singleflight_shared_by_key', 'gauge',
+                        {'step': step, 'key': flight_label(key)}, count))
+    for name, value in sorted(admission_control.stats.snapshot().items()):
+        endpoint, outcome = name.rsplit('.', 1)
+        if outcome.endswith('_cost'):
+            samples.append(('bitstore_admission_cost_total', 'counter',
+                            {'endpoint': endpoint, 'outcome': outcome[:-len('_cost')]}, value))
+        else:
+            samples.append(('bitstore_admission_requests_total', 'counter',
+                            {'endpoint': endpoint, 'outcome': outcome}, value))
+    dedup = dedup_stats.snapshot()
+    for outcome in ('hits', 'misses'):
+        samples.append(('bitstore_dedup_files_total', 'counter',
+                        {'outcome': outcome}, dedup.get(outcome, 0)))
+    samples.append(('bitstore_dedup_bytes_saved_total', 'counter', {},
+                    dedup.get('bytes_saved', 0)))
+    if existence_index is not None:
+        stats = existence_index.stats()
+        samples.extend([
+            ('bitstore_existence_index_keys', 'gauge', {}, stats['keys']),
+            ('bitstore_existence_index_memory_bytes', 'gauge', {}, stats['memory_bytes']),
+            ('bitstore_existence_index_false_positive_rate', 'gauge', {'kind': 'expected'},
+             stats['expected_false_positive_rate']),
+            ('bitstore_existence_index_false_positive_rate', 'gauge', {'kind': 'observed'},
+             stats['observed_false_positive_rate']),
+        ])
+    return recorder.render(samples)
+
+
+def flight_label(key):
+    """Identify a single-flight key (a URL or a tuple of them) in a metric label.
+
+    The keys contain private object keys and owner ids and /metrics is not
+    authenticated, so only a hash of them is published.
+    """
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:16]
+
+
+def caller_id(permissions):
+    """Identify a caller for admission control: by userid, or by client
+    address for anonymous requests.
+    """
+    userid = (permissions or {}).get('userid')
+    if userid is None and has_request_context() and request.remote_addr:
+        return 'address:%s' % request.remote_addr
+    return userid
+
+
+def throttled(error):
+    """Make the 429 response of a request which was not admitted.
+    """
+    return Response(str(error), status=429,
+                    headers={'Retry-After': admission.retry_after_header(error)})
+
+
+def invalidate_presigned_urls(bucket, key=None):
+    """Forget cached download URLs for an object (or a whole bucket).
+    """
+    presign_cache.invalidate(
+        predicate=lambda k: k[0] == bucket and (key is None or k[1] == key))
+
+
+def invalidate_usage(owner=None):
+    """Forget the cached storage totals of an owner (e.g. after an upload).
+    """
+    usage_cache.invalidate(owner)
 
 
 def format_s3_path(file, owner, dataset_name, path):
-    format_params = dict(file)
-    format_params.update({
-        'owner': owner,
-        'dataset': dataset_name,
-        'path': path,
-        'basename': os.path.basename(path),
-        'dirname': os.path.dirname(path),
-        'extension': os.path.splitext(path)[1],
-    })
-    if 'md5' in format_params:
-        try:
-            md5 = base64.b64decode(format_params['md5'])
-            format_params['md5_hex'] = codecs.encode(md5, 'hex').decode('ascii')
-        except Exception:
-            pass
+    return paths.compile_pattern(config['STORAGE_PATH_PATTERN']).format(
+        file, owner, dataset_name, path)
+
+
+def sign_upload(signer, bucket, s3path, acl, file):
+    """Generate the presigned POST form for uploading a single file.
+    """
+    s3headers = {
+        'acl': acl,
+        'Content-MD5': file['md5'],
+        'Content-Type': file.get('type', 'text/plain')
+    }
+
+    conditions = [
+        {'acl': acl},
+        {'Content-Type': s3headers['Content-Type']},
+        {'Content-MD5': s3headers['Content-MD5']}
+    ]
+
+    return signer.generate_presigned_post(
+            Bucket=bucket,
+            Key=s3path,
+            Fields=s3headers,
+            Conditions=conditions
+            )
 
+
+def authorize_prefix(signer, bucket, key_prefix, acl, filedata, s3paths, existing):
+    """Make an authorize response with a single upload policy for all files.
+
+    The policy accepts any key under the dataset prefix, with the request's
+    acl and a size within the range of the declared file lengths. Files only
+    carry their key, to be set in the form by the client.
+    """
+    lengths = [file['length'] for file in filedata.values()]
+    conditions = [
+        {'acl': acl},
+        ['starts-with', '$Content-Type', ''],
+        ['starts-with', '$Content-MD5', ''],
+        ['content-length-range', min(lengths, default=0), max(lengths, default=0)]
+    ]
+    post = signer.generate_presigned_post(
+        Bucket=bucket,
+        Key=key_prefix + '${filename}',
+        Fields={'acl': acl},
+        Conditions=conditions
+    )
+    res_payload = {
+        'upload_policy': {
+            'upload_url': post['url'],
+            'upload_query': post['fields'],
+            'key_prefix': key_prefix
+        },
+        'filedata': {}
+    }
+    for path, file in filedata.items():
+        entry = {
+            'key': s3paths[path],
+            'exists': existing[s3paths[path]] is not None
+        }
+        if 'type' in file:
+            entry['type'] = file['type']
+        res_payload['filedata'][path] = entry
+    return res_payload
+
+
+def is_same_content(obj, file):
+    """Check whether a stored object (as found by the existence check) has the
+    content described by the file info, by comparing its ETag with the md5.
+    """
+    if obj is None:
+        return False
     try:
-        s3path = config['STORAGE_PATH_PATTERN'].format(**format_params)
-    except KeyError as e:
-        msg = ('STORAGE_PATH_PATTERN contains variable not found in file info: %s' % e)
-        raise ValueError(msg)
+        md5_hex = base64.b64decode(file['md5']).hex()
+    except Exception:
+        return False
+    return obj['ETag'].strip('"') == md5_hex
+
+
+def stored_acl(s3, bucket, s3path):
+    """Return the canned ACL ('public-read' or 'private') of a stored object,
+    or None if it cannot be read.
+    """
+    try:
+        grants = s3.get_object_acl(Bucket=bucket, Key=s3path)['Grants']
+    except Exception: # noqa
+        logging.exception('Failed to read the ACL of %s', s3path)
+        return None
+    for grant in grants:
+        if grant['Grantee'].get('URI') == ALL_USERS and grant['Permission'] in ('READ', 'FULL_CONTROL'):
+            return 'public-read'
+    return 'private'
+
+
+def start_multipart_upload(s3, signer, bucket, s3path, acl, file, owner):
+    """Create a multipart upload for a large file and presign its parts.
+    """
+    upload_id, parts = multipart.start(
+        s3, signer, bucket, s3path, acl,
+        content_type=file.get('type', 'text/plain'),
+        length=file['length'],
+        part_size=int(config.get('MULTIPART_PART_SIZE', 64 * 1024 * 1024)),
+        expires_in=int(config.get('MULTIPART_EXPIRES_IN', 3600 * 24)),
+        md5=file['md5'])
+    return {
+        'key': s3path,
+        'upload_id': upload_id,
+        'upload_token': multipart.upload_token(
+            config['STORAGE_SECRET_ACCESS_KEY'], bucket, s3path, upload_id, owner),
+        'parts': parts
+    }
+
+
+def stream_filedata(filedata):
+    """Serialize (path, filedata) pairs into an authorize response, chunk by chunk.
+
+    The concatenated chunks are identical to `json.dumps({'filedata': ...})`.
+    """
+    yield '{"filedata": {'
+    separator = ''
+    for path, entry in filedata:
+        yield '%s%s: %s' % (separator, json.dumps(path), json.dumps(entry))
+        separator = ', '
+    yield '}}'
+
+
+def check_quota(registry, owner, permissions, is_private, filedata):
+    """Check that the files fit in the owner's storage plan.
+    :return: a 403 response if they do not, None otherwise
+    """
+    limits = permissions.get('permissions')
+    limit = limits.get(
+        'max_private_storage_mb' if is_private else 'max_public_storage_mb', 0
+    )
+    with recorder.timer('authorize', 'quota'):
+        current_storage = usage_cache.get_total_size(
+            registry, owner, 'private' if is_private else None
+        )
+
+    # Manifests read by the ingest stage come with their total size
+    total_bytes = getattr(filedata, 'total_bytes', None)
+    if total_bytes is None:
+        total_bytes = sum(file['length'] for file in filedata.values())
+
+    if current_storage + total_bytes > limit * 1000000:
+        return Response(status=403,
+            response='Max %sstorage for user exceeded plan limit (%dMB)' % (
+                'private ' if is_private else '', limit))
+    return None
+
+
+def locate_files(filedata, owner, dataset_name):
+    """Find the storage key of each file, where it is written and what is
+    already stored there.
+    :return: tuple of (dict mapping paths to keys, dict mapping keys to the
+        stored object or None, dict mapping keys to their (client, bucket))
+    """
+    with recorder.timer('authorize', 'paths'):
+        s3paths = dict(
+            (path, format_s3_path(file, owner, dataset_name, path))
+            for path, file in filedata.items()
+        )
+    with recorder.timer('authorize', 'existence'):
+        existing, locations = find_existing_sharded(s3paths.values())
+    return s3paths, existing, locations
+
+
+def authorize_dataset(req_payload, owner, dataset_name, acl, s3paths, existing, locations):
+    """Sign a single upload policy for the whole dataset, if the client asked
+    for it and all its files go to the same bucket.
+    :return: the JSON response, or None to sign each file instead
+    """
+    if req_payload.get('upload_mode') != 'prefix':
+        return None
+    key_prefix = paths.compile_pattern(config['STORAGE_PATH_PATTERN']).dataset_prefix(
+        owner, dataset_name)
+    if not key_prefix or len(set(bucket for _, bucket in locations.values())) > 1:
+        return None
+    client, bucket = next(iter(locations.values()),
+                          (get_s3_client(), config['STORAGE_BUCKET_NAME']))
+    report_stored_keys(s3paths.values())
+    with recorder.timer('authorize', 'sign'):
+        return json.dumps(authorize_prefix(
+            get_signer(client), bucket, key_prefix, acl, req_payload['filedata'],
+            s3paths, existing))
+
+
+def make_file_signer(s3paths, existing, locations, acl, owner):
+    """Return a function making the authorize response entry of a (path, file) item.
+    """
+    multipart_threshold = int(config.get('MULTIPART_THRESHOLD', 0))
+    dedup = is_enabled('AUTHORIZE_DEDUP') and \
+        paths.compile_pattern(config['STORAGE_PATH_PATTERN']).content_addressed
+
+    def make_filedata(item):
+        path, file = item
+        s3path = s3paths[path]
+        client, bucket = locations[s3path]
+        signer = get_signer(client)
+        if dedup and is_same_content(existing[s3path], file) and \
+                stored_acl(client, bucket, s3path) == acl:
+            dedup_stats.inc('hits')
+            dedup_stats.inc('bytes_saved', file['length'])
+            filedata = {
+                'exists': True,
+                'upload_needed': False
+            }
+        elif multipart_threshold and file['length'] >= multipart_threshold:
+            filedata = {
+                'multipart': start_multipart_upload(client, signer, bucket, s3path, acl, file, owner),
+                'exists': existing[s3path] is not None
+            }
+        else:
+            post = sign_upload(signer, bucket, s3path, acl, file)
+            filedata = {
+                'upload_url': post['url'],
+                'upload_query': post['fields'],
+                'exists': existing[s3path] is not None
+            }
+        if 'upload_needed' not in filedata:
+            report_stored_keys([s3path])
+            if dedup:
+                dedup_stats.inc('misses')
+        if 'type' in file:
+            filedata['type'] = file['type']
+        return filedata
+
+    return make_filedata
 
-    return s3path
 
+def iter_filedata(items, make_filedata, report_errors):
+    """Yield the (path, entry) pairs of an authorize response.
 
+    Large manifests are signed on the shared worker pool, with at most
+    AUTHORIZE_MAX_INFLIGHT files queued at a time (half the pool by default)
+    so one request leaves room for the others.
+    :param report_errors: give files failing to sign an `error` entry
+        instead of raising (always the case on the worker pool)
+    """
+    pool = get_worker_pool()
+    if pool is not None and \
+            len(items) >= int(config.get('AUTHORIZE_PARALLEL_THRESHOLD', 100)):
+        max_inflight = int(config.get('AUTHORIZE_MAX_INFLIGHT', max(1, pool.max_workers // 2)))
+        for (path, _), filedata, error in pool.imap(make_filedata, items, max_inflight):
+            if error is not None:
+                logging.error('Failed to sign upload for %s: %s', path, error)
+                filedata = {'error': str(error)}
+            yield path, filedata
+    elif report_errors:
+        for item in items:
+            try:
+                yield item[0], make_filedata(item)
+            except Exception as error: # noqa
+                logging.exception('Failed to sign upload for %s', item[0])
+                yield item[0], {'error': str(error)}
+    else:
+        for item in items:
+            yield item[0], make_filedata(item)
+
+
+def authorize_files(ticket, filedata, make_filedata):
+    """Sign every file and make the response, streamed for large manifests.
+    """
+    stream_threshold = int(config.get('AUTHORIZE_STREAM_THRESHOLD', 0))
+    if stream_threshold and len(filedata) >= stream_threshold:
+        return ticket.defer(Response(
+            stream_filedata(iter_filedata(filedata.items(), make_filedata, True)),
+            mimetype='application/json'))
+    with recorder.timer('authorize', 'sign'):
+        res_payload = {'filedata': dict(iter_filedata(filedata.items(), make_filedata, False))}
+
+    # Return response payload
+    with recorder.timer('authorize', 'serialize'):
+        return json.dumps(res_payload)
+
+
+@recorder.timed('authorize')
 def authorize(auth_token, req_payload, verifyer: auth.lib.Verifyer, registry: FileManager):
     """Authorize a client for the file uploading.
     """
-    s3 = get_s3_client()
+    ticket = None
     try:
         # Get request payload
         metadata = req_payload.get('metadata', {})
@@ -89,110 +692,188 @@ def authorize(auth_token, req_payload, verifyer: auth.lib.Verifyer, registry: Fi
         findability = metadata.get('findability')
         is_private = findability == 'private'
         acl = 'private' if is_private else 'public-read'
-        permissions = verifyer.extract_permissions(auth_token)
+        with recorder.timer('authorize', 'verify'):
+            permissions = verifyer.extract_permissions(auth_token)
 
         # Verify client, deny access if not verified
         if owner is None:
             return Response(status=400)
         if not permissions or permissions.get('userid') != owner:
             return Response(status=401)
+        filedata = req_payload['filedata']
+        ticket = admission_control.admit('authorize', owner, len(filedata))
 
-        limits = permissions.get('permissions')
-        limit = limits.get(
-            'max_private_storage_mb' if is_private else 'max_public_storage_mb', 0
-        )
-        current_storage = registry.get_total_size_for_owner(
-            owner, 'private' if is_private else None
-        )
+        over_quota = check_quota(registry, owner, permissions, is_private, filedata)
+        if over_quota is not None:
+            return over_quota
 
-        total_bytes = 0
-        for file in req_payload['filedata'].values():
-            total_bytes += file['length']
+        # Check which objects are already stored, and where to write them
+        s3paths, existing, locations = locate_files(filedata, owner, dataset_name)
 
-        if current_storage + total_bytes > limit * 1000000:
-            return Response(status=403,
-                response='Max %sstorage for user exceeded plan limit (%dMB)' % (
-                    'private ' if is_private else '', limit))
+        res_payload = authorize_dataset(
+            req_payload, owner, dataset_name, acl, s3paths, existing, locations)
+        if res_payload is not None:
+            return res_payload
 
         # Make response payload
-        res_payload = {'filedata': {}}
-        for path, file in req_payload['filedata'].items():
-            s3path = format_s3_path(file, owner, dataset_name, path)
-            bucket = config['STORAGE_BUCKET_NAME']
-
-            objs = s3.list_objects_v2(Bucket=bucket, Prefix=s3path)
-            exists = True if objs.get('KeyCount') else False
-
-            s3headers = {
-                'acl': acl,
-                'Content-MD5': file['md5'],
-                'Content-Type': file.get('type', 'text/plain')
-            }
+        return authorize_files(
+            ticket, filedata, make_file_signer(s3paths, existing, locations, acl, owner))
 
-            conditions = [
-                {'acl': acl},
-                {'Content-Type': s3headers['Content-Type']},
-                {'Content-MD5': s3headers['Content-MD5']}
-            ]
+    except admission.Throttled as error:
+        return throttled(error)
+    except Exception as exception: # noqa
+        logging.exception('Bad request (authorize)')
+        return Response(status=400)
+    finally:
+        if ticket is not None:
+            ticket.release()
 
-            post = s3.generate_presigned_post(
-                    Bucket=bucket,
-                    Key=s3path,
-                    Fields=s3headers,
-                    Conditions=conditions
-                    )
 
-            filedata = {
-                'upload_url': post['url'],
-                'upload_query': post['fields'],
-                'exists': exists
-            }
-            if 'type' in file:
-                filedata['type'] = file['type']
-            res_payload['filedata'][path] = filedata
+def complete_multipart(auth_token, req_payload, verifyer: auth.lib.Verifyer):
+    """Complete a multipart upload started by authorize.
+    :param req_payload: {'owner', 'key', 'upload_id', 'upload_token',
+        'parts': [{'part_number': ..., 'etag': ...}, ...]}
+    """
+    try:
+        status, location = check_multipart_request(auth_token, req_payload, verifyer)
+        if status != 200:
+            return Response(status=status)
+        s3, bucket = location
+        parts = [{'PartNumber': part['part_number'], 'ETag': part['etag']}
+                 for part in req_payload['parts']]
+        ret = s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=req_payload['key'],
+            UploadId=req_payload['upload_id'],
+            MultipartUpload={'Parts': parts})
+        if config.get('MULTIPART_VERIFY_MD5', 'true').lower() in ('1', 'true', 'yes', 'on') and \
+                not multipart.verify_md5(s3, bucket, req_payload['key']):
+            s3.delete_object(Bucket=bucket, Key=req_payload['key'])
+            return Response(status=400, response='Uploaded content does not match the declared md5')
+        invalidate_usage(req_payload['owner'])
+        report_stored_keys([req_payload['key']])
+        return json.dumps({'key': req_payload['key'], 'etag': ret.get('ETag')})
+    except Exception as exception: # noqa
+        logging.exception('Bad request (complete_multipart)')
+        return Response(status=400)
 
-        # Return response payload
-        return json.dumps(res_payload)
 
+def abort_multipart(auth_token, req_payload, verifyer: auth.lib.Verifyer):
+    """Abort a multipart upload started by authorize, discarding its parts.
+    :param req_payload: {'owner', 'key', 'upload_id', 'upload_token'}
+    """
+    try:
+        status, location = check_multipart_request(auth_token, req_payload, verifyer)
+        if status != 200:
+            return Response(status=status)
+        s3, bucket = location
+        s3.abort_multipart_upload(
+            Bucket=bucket,
+            Key=req_payload['key'],
+            UploadId=req_payload['upload_id'])
+        return json.dumps({'key': req_payload['key'], 'aborted': True})
     except Exception as exception: # noqa
-        logging.exception('Bad request (authorize)')
+        logging.exception('Bad request (abort_multipart)')
         return Response(status=400)
 
 
+def check_multipart_request(auth_token, req_payload, verifyer):
+    """Check that the caller owns the multipart upload it refers to, and find
+    the bucket it was started in: the shard of its key, or STORAGE_BUCKET_NAME
+    for uploads started before sharding.
+    :return: tuple of (HTTP status, 200 if allowed; (client, bucket) of the upload)
+    """
+    owner = req_payload.get('owner')
+    if owner is None:
+        return 400, None
+    permissions = verifyer.extract_permissions(auth_token)
+    if not permissions or permissions.get('userid') != owner:
+        return 401, None
+    key = req_payload['key']
+    locations = [locate_key(key)]
+    if locations[0][1] != config['STORAGE_BUCKET_NAME']:
+        locations.append((get_s3_client(), config['STORAGE_BUCKET_NAME']))
+    for client, bucket in locations:
+        if multipart.check_upload_token(
+                config['STORAGE_SECRET_ACCESS_KEY'], bucket,
+                key, req_payload['upload_id'], owner,
+                req_payload.get('upload_token')):
+            return 200, (client, bucket)
+    return 403, None
+
+
+@functools.lru_cache(maxsize=16)
+def info_templates(buckets):
+    """Return the /info prefixes of the storage buckets, to be completed with
+    the userid, and a digest of them used to derive ETags.
+    :param buckets: tuple of bucket names, as returned by storage_buckets
+    """
+    prefixes = []
+    for bucket in buckets:
+        for scheme, port in [('http', '80'), ('https', '443')]:
+            prefixes.extend([
+                '%s://%s:%s/' % (scheme, bucket, port),
+                '%s://%s/' % (scheme, bucket),
+                ])
+    digest = hashlib.sha256('\n'.join(prefixes).encode('utf-8')).digest()
+    return prefixes, digest
+
+
+def info_etag(buckets, userid):
+    """Strong ETag of the /info payload of a user, computed without building it.
+    """
+    _, digest = info_templates(buckets)
+    return hashlib.sha256(digest + userid.encode('utf-8')).hexdigest()[:32]
+
+
+def info_payload(buckets, userid):
+    prefixes, _ = info_templates(buckets)
+    return json.dumps({'prefixes': [prefix + userid for prefix in prefixes]})
+
+
 def info(auth_token, verifyer: auth.lib.Verifyer):
     """Authorize a client for the file uploading.
     :param auth_token: authentication token to test
+    :return: the JSON payload of `info_response`, or its error response
     """
-    # Verify client, deny access if not verified
+    response = info_response(auth_token, verifyer)
+    if response.status_code != 200:
+        return response
+    return response.get_data(as_text=True)
+
 
+@recorder.timed('info')
+def info_response(auth_token, verifyer: auth.lib.Verifyer, if_none_match=None):
+    """Return the storage prefixes of the client, as a cacheable response
+    answering conditional requests.
+    :param if_none_match: value of the If-None-Match request header
+    """
     try:
-        # Get request payload
-        permissions = verifyer.extract_permissions(auth_token)
+        with recorder.timer('info', 'verify'):
+            permissions = verifyer.extract_permissions(auth_token)
         if not permissions:
             return Response(status=401)
         userid = permissions.get('userid')
 
-        # Make response payload
-        urls = []
-        for scheme, port in [('http', '80'), ('https', '443')]:
-            for host, path in [(config['STORAGE_BUCKET_NAME'], '')]:
-                urls.extend([
-                    '%s://%s:%s/%s' % (scheme, host, port, path),
-                    '%s://%s/%s' % (scheme, host, path),
-                    ])
-        urls = [os.path.join(url, userid) for url in urls]
-        response_payload = {
-            'prefixes': urls
+        buckets = storage_buckets()
+        etag = info_etag(buckets, userid)
+        headers = {
+            'ETag': '"%s"' % etag,
+            'Cache-Control': 'private, max-age=%d' % int(config.get('INFO_CACHE_MAX_AGE', 300)),
+            'Vary': 'Auth-Token'
         }
-
-        # Return response payload
-        return json.dumps(response_payload)
+        if if_none_match and parse_etags(if_none_match).contains_weak(etag):
+            return Response(status=304, headers=headers)
+        with recorder.timer('info', 'render'):
+            return Response(info_payload(buckets, userid), headers=headers,
+                            mimetype='application/json')
 
     except Exception as exception: # noqa
         logging.exception('Bad request (info)')
         return Response(status=400)
 
 
+@recorder.timed('presign')
 def presign(auth_token, url, verifyer: auth.lib.Verifyer, ownerid=None):
     """Generates S3 presigned URLs if necessary
     :param auth_token: authentication token from auth
@@ -200,35 +881,264 @@ def presign(auth_token, url, verifyer: auth.lib.Verifyer, ownerid=None):
     :param url: url to check for sigend URL
     """
     s3 = get_s3_client()
+    ticket = None
     try:
-        needs_signed_url = requests.head(url)
-        if needs_signed_url.status_code != 403:
-            return json.dumps({'url': url})
-        # Verify client, deny access if not verified
-        if ownerid is None:
-            return Response(status=401)
-        permissions = verifyer.extract_permissions(auth_token)
-        if not permissions or permissions.get('userid') != ownerid:
-            return Response(status=403)
-        parsed_url = urllib.parse.urlparse(url)
-        bucket = parsed_url.netloc
-        key = parsed_url.path.lstrip('/')
-        # Handle s3 path-style URLs
-        if bucket.endswith('amazonaws.com'):
-            bucket, key = key.split('/', 1)
-
-        # Make sure file belongs to user (only in case of pkgstore)
-        if (config['STORAGE_BUCKET_NAME'] != bucket) and (ownerid not in url):
-            return Response(status=403)
-
-        signed_url = s3.generate_presigned_url(
-            ClientMethod='get_object',
-            Params={
-                'Bucket': bucket,
-                'Key': key
-            },
-            ExpiresIn=3600*24)
+        permissions = None
+        admitted = admission_control.applies('presign')
+        if admitted:
+            # The token is needed to tell callers apart, check it right away
+            permissions = verifyer.extract_permissions(auth_token) if auth_token else None
+            ticket = admission_control.admit('presign', caller_id(permissions))
+
+        def get_permissions():
+            return permissions if admitted else verifyer.extract_permissions(auth_token)
+
+        status, signed_url = sign_download(s3, url, ownerid, get_permissions)
+        if status != 200:
+            return Response(status=status)
         return json.dumps({'url': signed_url})
+    except admission.Throttled as error:
+        return throttled(error)
     except Exception as exception: # noqa
         logging.exception('Bad request')
         return Response(status=400)
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+@recorder.timed('presign_bulk')
+def presign_bulk(auth_token, req_payload, verifyer: auth.lib.Verifyer):
+    """Generates S3 presigned URLs for many URLs at once
+    :param auth_token: authentication token from auth
+    :param req_payload: {'urls': [{'url': ..., 'ownerid': ...}, ...]}
+    """
+    s3 = get_s3_client()
+    ticket = None
+    try:
+        entries = req_payload['urls']
+        if len(entries) > int(config.get('PRESIGN_BULK_MAX_URLS', 1000)):
+            return Response(status=413)
+        permissions = verifyer.extract_permissions(auth_token) if auth_token else None
+        ticket = admission_control.admit('presign_bulk', caller_id(permissions), len(entries))
+
+        res_payload = {'urls': {}}
+        for entry, result in presign_entries(s3, entries, permissions):
+            res_payload['urls'][entry['url']] = result
+        return json.dumps(res_payload)
+    except admission.Throttled as error:
+        return throttled(error)
+    except Exception as exception: # noqa
+        logging.exception('Bad request (presign_bulk)')
+        return Response(status=400)
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+def presign_entry(s3, entry, permissions):
+    """Sign one URL of a bulk request.
+    :return: {'status', 'url'}, without url unless the status is 200
+    """
+    try:
+        status, signed_url = sign_download(
+            s3, entry['url'], entry.get('ownerid'), lambda: permissions,
+            endpoint='presign_bulk')
+    except Exception as exception: # noqa
+        logging.exception('Bad request (presign_bulk)')
+        return {'status': 400}
+    if status != 200:
+        return {'status': status}
+    return {'status': status, 'url': signed_url}
+
+
+def presign_entries(s3, entries, permissions):
+    """Sign the URLs of a bulk request on the presign pool, with at most
+    PRESIGN_BULK_WORKERS of them in flight.
+    :return: iterator of (entry, result) pairs
+    """
+    sign = functools.partial(presign_entry, s3, permissions=permissions)
+    pool = get_presign_pool()
+    if pool is None:
+        return ((entry, sign(entry)) for entry in entries)
+    return ((entry, result) for entry, result, _ in pool.imap(
+        sign, entries, int(config.get('PRESIGN_BULK_WORKERS', 8))))
+
+
+@recorder.timed('dataset_manifest')
+def dataset_manifest(auth_token, owner, dataset, verifyer: auth.lib.Verifyer):
+    """Sign download URLs for every stored file of a dataset
+    :param auth_token: authentication token from auth
+    :param owner: owner of the dataset, who must be the caller
+    :param dataset: dataset name
+    :return: streamed {'prefix', 'files': [{'key', 'size', 'etag', 'url'}, ...]}
+    """
+    ticket = None
+    try:
+        if owner is None or dataset is None:
+            return Response(status=400)
+        with recorder.timer('dataset_manifest', 'verify'):
+            permissions = verifyer.extract_permissions(auth_token)
+        if not permissions or permissions.get('userid') != owner:
+            return Response(status=401)
+        ticket = admission_control.admit('dataset_manifest', owner)
+        prefix = paths.compile_pattern(config['STORAGE_PATH_PATTERN']).dataset_prefix(
+            owner, dataset)
+        if not prefix:
+            return Response('STORAGE_PATH_PATTERN has no dataset prefix', status=400)
+
+        pages = iter_dataset_pages(prefix)
+        # Fetch the first page now, so that listing errors get a status
+        first_page = next(pages)
+        return ticket.defer(Response(
+            stream_manifest(prefix, first_page, pages),
+            mimetype='application/json'))
+    except admission.Throttled as error:
+        return throttled(error)
+    except Exception as exception: # noqa
+        logging.exception('Bad request (dataset_manifest)')
+        return Response(status=400)
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+def iter_listing(s3, bucket, prefix):
+    """Yield the pages of objects stored under a prefix.
+    """
+    params = {'Bucket': bucket, 'Prefix': prefix,
+              'MaxKeys': int(config.get('DATASET_MANIFEST_PAGE_SIZE', 1000))}
+    while True:
+        with recorder.timer('dataset_manifest', 'list'):
+            page = s3.list_objects_v2(**params)
+        yield page.get('Contents', [])
+        if not page.get('IsTruncated'):
+            return
+        params['ContinuationToken'] = page['NextContinuationToken']
+
+
+def iter_dataset_pages(prefix):
+    """Yield (bucket, objects) pages of the files stored under a prefix, in
+    all the storage buckets.
+
+    Shards are listed before STORAGE_BUCKET_NAME, whose keys already found in
+    a shard are skipped: a file rewritten since sharding is listed once.
+    """
+    buckets = storage_buckets()
+    if len(buckets) == 1:
+        for page in iter_listing(get_s3_client(), buckets[0], prefix):
+            yield buckets[0], page
+        return
+    seen = set()
+    for bucket in buckets[1:] + buckets[:1]:
+        for page in iter_listing(get_bucket_client(bucket), bucket, prefix):
+            page = [obj for obj in page if obj['Key'] not in seen]
+            seen.update(obj['Key'] for obj in page)
+            yield bucket, page
+
+
+def stream_manifest(prefix, first_page, pages):
+    """Serialize a dataset manifest, signing and writing out one page at a time.
+    :param first_page, pages: (bucket, objects) pages from iter_dataset_pages
+    """
+    yield '{"prefix": %s, "files": [' % json.dumps(prefix)
+    separator = ''
+    for bucket, page in itertools.chain([first_page], pages):
+        signer = get_signer(get_bucket_client(bucket))
+        with recorder.timer('dataset_manifest', 'sign'):
+            entries = []
+            for obj in page:
+                entries.append(json.dumps({
+                    'key': obj['Key'],
+                    'size': obj['Size'],
+                    'etag': obj['ETag'].strip('"'),
+                    'url': signer.generate_presigned_url(
+                        ClientMethod='get_object',
+                        Params={'Bucket': bucket, 'Key': obj['Key']},
+                        ExpiresIn=PRESIGN_EXPIRES_IN)
+                }))
+        if entries:
+            yield separator + ', '.join(entries)
+            separator = ', '
+    yield ']}'
+
+
+def sign_download(s3, url, ownerid, get_permissions, endpoint='presign'):
+    """Check whether a URL needs signing and sign it for its owner.
+    :param get_permissions: callable returning the permissions of the caller,
+        only called when the URL needs signing
+    :param endpoint: endpoint the stage timings are reported under
+    :return: tuple of (HTTP status, URL to use)
+    """
+    parsed_url = urllib.parse.urlparse(url)
+    bucket = parsed_url.netloc
+    key = parsed_url.path.lstrip('/')
+    # Handle s3 path-style URLs
+    if bucket.endswith('amazonaws.com'):
+        bucket, key = key.split('/', 1)
+
+    # Files in our own buckets are public unless private, so only their
+    # owner, who gets a signed URL either way, may skip the probe
+    own_bucket = bucket in storage_buckets()
+    permissions = None
+    if own_bucket and ownerid is not None and \
+            is_enabled('PRESIGN_SKIP_PROBE_FOR_PRIVATE_BUCKET'):
+        with recorder.timer(endpoint, 'verify'):
+            permissions = get_permissions() or {}
+    if ownerid is None or (permissions or {}).get('userid') != ownerid:
+        with recorder.timer(endpoint, 'probe'):
+            needs_signing = flights.do('probe', url, prober.needs_signing, url)
+        if not needs_signing:
+            return 200, url
+    # Verify client, deny access if not verified
+    if ownerid is None:
+        return 401, None
+    if permissions is None:
+        with recorder.timer(endpoint, 'verify'):
+            permissions = get_permissions()
+    if not permissions or permissions.get('userid') != ownerid:
+        return 403, None
+
+    # Make sure file belongs to user (only in case of pkgstore)
+    if not own_bucket and (ownerid not in url):
+        return 403, None
+
+    cache_key = (bucket, key, ownerid)
+    signed_url = presign_cache.get(cache_key)
+    if signed_url is None:
+        with recorder.timer(endpoint, 'sign'):
+            signed_url = flights.do('sign', cache_key, presign_download, s3, bucket, key, cache_key)
+    return 200, signed_url
+
+
+def resolve_download(s3, bucket, key):
+    """Return the client and bucket to sign a download with.
+
+    With sharding, objects of our buckets are signed with the client of their
+    shard, and URLs of STORAGE_BUCKET_NAME are redirected to the shard of
+    their key once the file has been written there.
+    """
+    if get_ring() is None or bucket not in storage_buckets():
+        return s3, bucket
+    if bucket == config['STORAGE_BUCKET_NAME'] and legacy_lookup_enabled():
+        client, shard_bucket = locate_key(key)
+        if shard_bucket != bucket and \
+                find_existing(client, shard_bucket, [key])[key] is not None:
+            return client, shard_bucket
+    return get_bucket_client(bucket), bucket
+
+
+def presign_download(s3, bucket, key, cache_key):
+    """Sign a download URL and cache it under `cache_key`.
+    """
+    s3, bucket = resolve_download(s3, bucket, key)
+    signed_url = get_signer(s3).generate_presigned_url(
+        ClientMethod='get_object',
+        Params={
+            'Bucket': bucket,
+            'Key': key
+        },
+        ExpiresIn=PRESIGN_EXPIRES_IN)
+    reuse_fraction = float(config.get('PRESIGN_CACHE_REUSE_FRACTION', 0.5))
+    presign_cache.set(cache_key, signed_url, PRESIGN_EXPIRES_IN * reuse_fraction)
+    return signed_url
@@ -0,0 +1,88 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+
+MISSING_CODES = ('404', 'NoSuchKey', 'NotFound')
+
+
+def plan(keys, list_threshold=3):
+    """Split keys into listing and HeadObject batches.
+
+    Keys are grouped by directory. A directory holding at least
+    `list_threshold` of the keys is resolved with one (paged) listing scoped
+    to the longest common prefix of its keys; every other key gets its own
+    HeadObject call. Keys without a common prefix are never listed, as that
+    would page through the bucket root.
+
+    :return: tuple of ([(prefix, keys), ...], [key, ...])
+    """
+    groups = {}
+    for key in keys:
+        groups.setdefault(key.rpartition('/')[0], []).append(key)
+
+    listings, heads = [], []
+    for group in groups.values():
+        prefix = os.path.commonprefix(group)
+        if len(group) >= list_threshold and prefix:
+            listings.append((prefix, group))
+        else:
+            heads.extend(group)
+    return listings, heads
+
+
+def resolve(s3, bucket, keys, max_workers=8, list_threshold=3, max_list_pages=10):
+    """Look up which of the given keys exist in the bucket.
+
+    Matching is exact, so a key that is merely a prefix of an existing
+    object is reported as missing.
+
+    :return: dict mapping each key to {'ETag', 'Size'} or None if missing
+    """
+    keys = list(dict.fromkeys(keys))
+    found = dict.fromkeys(keys)
+    listings, heads = plan(keys, list_threshold)
+    for prefix, group in listings:
+        if not _list(s3, bucket, prefix, group, found, max_list_pages):
+            heads.extend(key for key in group if found[key] is None)
+
+    if heads:
+        workers = max(1, min(max_workers, len(heads)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for key, info in zip(heads, executor.map(
+                    lambda key: _head(s3, bucket, key), heads)):
+                found[key] = info
+    return found
+
+
+def _list(s3, bucket, prefix, group, found, max_pages):
+    """Resolve a group of keys sharing a directory with a paged listing.
+
+    Returns False when the listing was cut short at `max_pages` before every
+    key was settled.
+    """
+    wanted = set(group)
+    last = max(key.encode('utf-8') for key in group)
+    params = {'Bucket': bucket, 'Prefix': prefix, 'Delimiter': '/'}
+    for _ in range(max_pages):
+        page = s3.list_objects_v2(**params)
+        for obj in page.get('Contents', []):
+            if obj['Key'] in wanted:
+                found[obj['Key']] = {'ETag': obj['ETag'], 'Size': obj['Size']}
+        contents = page.get('Contents')
+        if not page.get('IsTruncated') or \
+                (contents and contents[-1]['Key'].encode('utf-8') >= last):
+            return True
+        params['ContinuationToken'] = page['NextContinuationToken']
+    return False
+
+
+def _head(s3, bucket, key):
+    try:
+        obj = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in MISSING_CODES:
+            return None
+        raise
+    return {'ETag': obj['ETag'], 'Size': obj['ContentLength']}
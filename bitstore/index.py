@@ -0,0 +1,292 @@
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+
+class BloomFilter(object):
+    """Fixed-size Bloom filter over strings.
+    """
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / float(capacity) * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    @property
+    def memory_bytes(self):
+        return len(self.bits)
+
+    @property
+    def false_positive_rate(self):
+        """Expected false positive rate given the number of keys added.
+        """
+        return (1 - math.exp(-self.hashes * self.count / float(self.size))) ** self.hashes
+
+
+class ExistenceIndex(object):
+    """In-memory index of the keys stored in a bucket.
+
+    A Bloom filter built from a full bucket listing (or a snapshot of one)
+    and updated as new keys are reported. Keys it doesn't contain are
+    definitely absent, the others must be confirmed against S3.
+
+    Processes given the same `snapshot_path` share the index: one of them at
+    a time lists the bucket and saves the snapshot, which the others load,
+    and reported keys are appended to a journal next to the snapshot, which
+    `catch_up` replays in every process.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.01, snapshot_path=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.snapshot_path = snapshot_path
+        self.filter = BloomFilter(capacity, error_rate)
+        self.ready = False
+        self.synced_at = None
+        self.maybe = 0
+        self.confirmed = 0
+        self._pending = None
+        self._journal = snapshot_path + '.journal' if snapshot_path else None
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._snapshot_id = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def add(self, key):
+        self.add_keys([key])
+
+    def add_keys(self, keys):
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self.filter.add(key)
+            if self._pending is not None:
+                self._pending.extend(keys)
+        if self._journal:
+            data = ''.join(key + '\n' for key in keys if '\n' not in key).encode('utf-8')
+            if data:
+                # A single O_APPEND write, so lines from several processes don't interleave
+                fd = os.open(self._journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+
+    def might_exist(self, key):
+        """Return False if the key is definitely not stored.
+        """
+        return not self.ready or key in self.filter
+
+    def catch_up(self):
+        """Load the snapshot if another process saved a new one, and replay
+        the keys other processes reported since.
+        """
+        if not self.snapshot_path:
+            return
+        try:
+            snapshot_id = _file_id(os.stat(self.snapshot_path))
+        except OSError:
+            snapshot_id = None
+        if snapshot_id is not None and snapshot_id != self._snapshot_id:
+            self.load()
+        else:
+            with self._lock:
+                self._replay(self.filter)
+
+    def record(self, maybe, confirmed):
+        """Account for `maybe` keys checked against S3, of which `confirmed` existed.
+        """
+        with self._lock:
+            self.maybe += maybe
+            self.confirmed += confirmed
+
+    def refresh(self, s3, bucket, max_age):
+        """Rebuild the index, once for all the processes sharing its snapshot.
+
+        The process holding the snapshot lock lists the bucket and saves the
+        snapshot, unless another one did less than `max_age` seconds ago, in
+        which case that snapshot is loaded instead.
+        """
+        if not self.snapshot_path:
+            return self.sync(s3, bucket)
+        with open(self.snapshot_path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                age = time.time() - os.path.getmtime(self.snapshot_path)
+            except OSError:
+                age = None
+            if age is not None and age < max_age:
+                self.load()
+            else:
+                self.sync(s3, bucket)
+                self.save()
+
+    def sync(self, s3, bucket):
+        """Rebuild the filter from a full listing of the bucket.
+
+        Keys reported while the listing runs are carried over. With a
+        snapshot, callers must hold its lock (see `refresh`).
+        """
+        with self._lock:
+            self._pending = []
+        if self._journal:
+            # Keys reported from now on go to a new journal
+            try:
+                os.replace(self._journal, self._journal + '.prev')
+            except FileNotFoundError:
+                pass
+        try:
+            bloom = BloomFilter(self.capacity, self.error_rate)
+            paginator = s3.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket):
+                for obj in page.get('Contents', []):
+                    bloom.add(obj['Key'])
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for key in self._pending:
+                bloom.add(key)
+            self._pending = None
+            if self._journal:
+                # Keys other processes reported before and during the listing
+                _read_journal(self._journal + '.prev', bloom)
+                self._journal_inode = None
+                self._replay(bloom)
+            self.filter = bloom
+            self.ready = True
+            self.synced_at = time.time()
+
+    def _replay(self, bloom):
+        """Add the journal lines not read yet to `bloom` (with the lock held).
+        """
+        if not self._journal:
+            return
+        inode, self._journal_offset = _read_journal(
+            self._journal, bloom, self._journal_inode, self._journal_offset)
+        self._journal_inode = inode
+
+    def save(self, path=None):
+        """Write a snapshot of the filter to a file (the index snapshot by default).
+        """
+        path = path or self.snapshot_path
+        with self._lock:
+            header = {'capacity': self.capacity, 'error_rate': self.error_rate,
+                      'count': self.filter.count, 'synced_at': self.synced_at}
+            bits = bytes(self.filter.bits)
+        # Workers of a preforked server may save the same snapshot at once
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            f.write(bits)
+        os.replace(tmp_path, path)
+        if path == self.snapshot_path:
+            self._snapshot_id = _file_id(os.stat(path))
+
+    def load(self, path=None):
+        """Load a snapshot written by `save` (the index snapshot by default).
+        """
+        path = path or self.snapshot_path
+        with open(path, 'rb') as f:
+            snapshot_id = _file_id(os.fstat(f.fileno()))
+            header = json.loads(f.readline().decode('utf-8'))
+            bits = bytearray(f.read())
+        bloom = BloomFilter(header['capacity'], header['error_rate'], bits, header['count'])
+        if len(bits) != (bloom.size + 7) // 8:
+            raise ValueError('Corrupted existence index snapshot: %s' % path)
+        with self._lock:
+            self.capacity, self.error_rate = header['capacity'], header['error_rate']
+            if path == self.snapshot_path:
+                self._snapshot_id = snapshot_id
+                self._journal_inode = None
+                self._replay(bloom)
+            self.filter = bloom
+            self.ready = True
+            self.synced_at = header['synced_at']
+
+    def start_resync(self, s3, bucket, interval, retry_interval=60):
+        """Refresh the index every `interval` seconds in a daemon thread, or
+        every `retry_interval` seconds until a sync succeeds.
+
+        The first refresh is due `interval` seconds after the last sync, so
+        right away after loading an older snapshot.
+        """
+        def run():
+            if self.ready:
+                wait = max(0, (self.synced_at or 0) + interval - time.time())
+            else:
+                wait = min(interval, retry_interval)
+            while not self._stop.wait(wait):
+                try:
+                    self.refresh(s3, bucket, interval)
+                except Exception: # noqa
+                    logging.exception('Failed to resync the existence index')
+                wait = interval if self.ready else min(interval, retry_interval)
+
+        thread = threading.Thread(target=run, name='bitstore-index', daemon=True)
+        thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'ready': self.ready,
+            'keys': self.filter.count,
+            'memory_bytes': self.filter.memory_bytes,
+            'expected_false_positive_rate': self.filter.false_positive_rate,
+            'observed_false_positive_rate':
+                (self.maybe - self.confirmed) / float(self.maybe) if self.maybe else 0.0,
+            'synced_at': self.synced_at,
+        }
+
+
+def _file_id(stat):
+    # Snapshots are replaced rather than rewritten, so a new one has a new inode
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _read_journal(path, bloom, inode=None, offset=0):
+    """Add the keys of a journal from `offset` to `bloom`, starting over if
+    the journal is not the file `inode` any more.
+    :return: tuple of (inode, offset of the next line)
+    """
+    try:
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != inode or stat.st_size < offset:
+                offset = 0
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return None, 0
+    end = data.rfind(b'\n') + 1
+    for key in data[:end].decode('utf-8').splitlines():
+        if key not in bloom:
+            bloom.add(key)
+    return stat.st_ino, offset + end
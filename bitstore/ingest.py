@@ -0,0 +1,93 @@
+import base64
+import binascii
+import codecs
+import json
+import tempfile
+
+
+class ManifestError(ValueError):
+    pass
+
+
+class ManifestTooLarge(ManifestError):
+    pass
+
+
+def read_manifest(stream, max_bytes, max_files, content_length=None,
+                  chunk_size=64 * 1024, spool_size=1024 * 1024):
+    """Read and validate an authorize request body.
+
+    The body is copied to a spooled temporary file (in memory up to
+    `spool_size`, on disk above) while enforcing `max_bytes`, so an oversized
+    body is rejected before anything is decoded, then decoded in one pass and
+    its `filedata` entries validated and counted against `max_files`.
+
+    :return: the decoded payload, with `filedata` as a FileData
+    """
+    if content_length is not None and content_length > max_bytes:
+        raise ManifestTooLarge('Request body exceeds %d bytes' % max_bytes)
+    with tempfile.SpooledTemporaryFile(max_size=spool_size) as spool:
+        size = 0
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise ManifestTooLarge('Request body exceeds %d bytes' % max_bytes)
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            payload = json.load(codecs.getreader('utf-8')(spool))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise ManifestError('Invalid request body: %s' % e)
+    return validate_payload(payload, max_files)
+
+
+def validate_payload(payload, max_files):
+    """Check a decoded body, replacing its `filedata` with a FileData.
+    """
+    if not isinstance(payload, dict):
+        raise ManifestError('Invalid request body: expected an object')
+    if not isinstance(payload.get('filedata'), dict):
+        raise ManifestError('Invalid request body: missing filedata')
+    if len(payload['filedata']) > max_files:
+        raise ManifestTooLarge('Request has more than %d files' % max_files)
+    filedata = FileData()
+    for path, file in payload['filedata'].items():
+        validate_file(path, file)
+        filedata[path] = file
+        filedata.total_bytes += file['length']
+    payload['filedata'] = filedata
+    return payload
+
+
+def validate_file(path, file):
+    """Check the fields of a single filedata entry.
+    """
+    if not isinstance(file, dict):
+        raise ManifestError('File info for %s must be an object' % path)
+    length = file.get('length')
+    if not isinstance(length, int) or isinstance(length, bool) or length < 0:
+        raise ManifestError('Invalid length for %s' % path)
+    md5 = file.get('md5')
+    try:
+        valid_md5 = isinstance(md5, str) and \
+            len(base64.b64decode(md5, validate=True)) == 16
+    except (binascii.Error, ValueError):
+        valid_md5 = False
+    if not valid_md5:
+        raise ManifestError('Invalid md5 for %s' % path)
+    if 'type' in file and not isinstance(file['type'], str):
+        raise ManifestError('Invalid type for %s' % path)
+
+
+class FileData(dict):
+    """The filedata entries of a manifest, with their total length.
+
+    A path given more than once keeps its last entry, as with `json.loads`.
+    """
+
+    def __init__(self):
+        super(FileData, self).__init__()
+        self.total_bytes = 0
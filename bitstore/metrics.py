@@ -0,0 +1,236 @@
+import bisect
+import collections
+import functools
+import itertools
+import logging
+import random
+import threading
+import time
+
+
+class Counters(object):
+    """Thread-safe named counters.
+    """
+
+    def __init__(self):
+        self._values = collections.Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._values[name] += value
+
+    def get(self, name):
+        return self._values[name]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(object):
+    """Thread-safe cumulative latency histogram.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        """Return ([(upper bound, cumulative count), ...], count, sum).
+        """
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative = list(zip(self.buckets, itertools.accumulate(counts)))
+        return cumulative, count, total
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, recorder, endpoint, stage):
+        self.recorder = recorder
+        self.endpoint = endpoint
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = self.recorder.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = self.recorder.clock() - self.start
+        self.recorder.observe('bitstore_stage_seconds', elapsed,
+                              endpoint=self.endpoint, stage=self.stage)
+        self.recorder.trace(self.stage, elapsed)
+        return False
+
+
+class Recorder(object):
+    """Latency timers and counters of the request hot path.
+
+    Requests (`timed`) and their stages (`timer`) feed histograms, S3 calls
+    are counted and timed through botocore event hooks (`instrument_client`).
+    A `sample_rate` fraction of the requests also logs its stage timings.
+    When disabled, timers are a shared no-op and nothing is recorded.
+    """
+
+    def __init__(self, enabled=False, sample_rate=0.0, buckets=BUCKETS,
+                 clock=time.perf_counter):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.buckets = buckets
+        self.clock = clock
+        self.counters = Counters()
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            self.counters.inc((name, _label_key(labels)), value)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def trace(self, label, seconds):
+        """Add a timing to the log line of the current request, if sampled.
+        """
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.append((label, seconds))
+
+    def timer(self, endpoint, stage):
+        """Return a context manager timing a stage of an endpoint.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, endpoint, stage)
+
+    def timed(self, endpoint):
+        """Decorator timing the requests of an endpoint.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+                if sampled:
+                    self._local.trace = []
+                start = self.clock()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = self.clock() - start
+                    self.observe('bitstore_request_seconds', elapsed, endpoint=endpoint)
+                    if sampled:
+                        trace, self._local.trace = self._local.trace, None
+                        logging.info('%s took %.1fms (%s)', endpoint, elapsed * 1000, ', '.join(
+                            '%s=%.1fms' % (label, seconds * 1000) for label, seconds in trace))
+            return wrapper
+        return decorator
+
+    def instrument_client(self, client):
+        """Count and time the calls made by a boto3 client.
+        """
+        def before_call(model, context, **kwargs):
+            if self.enabled:
+                context['bitstore_start'] = self.clock()
+
+        def after_call(model, context, **kwargs):
+            start = context.pop('bitstore_start', None)
+            if start is not None:
+                elapsed = self.clock() - start
+                self.inc('bitstore_s3_calls_total', operation=model.name)
+                self.observe('bitstore_s3_call_seconds', elapsed, operation=model.name)
+                self.trace('s3.' + model.name, elapsed)
+
+        client.meta.events.register('before-call.s3', before_call)
+        client.meta.events.register('after-call.s3', after_call)
+
+    def render(self, samples=()):
+        """Render the metrics in the Prometheus text exposition format.
+
+        :param samples: extra (name, type, labels, value) samples, e.g. cache
+            statistics read at scrape time
+        """
+        metrics = collections.OrderedDict()
+        for (name, labels), value in sorted(self.counters.snapshot().items()):
+            metrics.setdefault((name, 'counter'), []).append(
+                _format_sample(name, labels, value))
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for (name, labels), histogram in histograms:
+            cumulative, count, total = histogram.snapshot()
+            lines = metrics.setdefault((name, 'histogram'), [])
+            for bound, value in cumulative:
+                lines.append(_format_sample(
+                    name + '_bucket', labels + (('le', repr(float(bound))),), value))
+            lines.append(_format_sample(name + '_bucket', labels + (('le', '+Inf'),), count))
+            lines.append(_format_sample(name + '_sum', labels, total))
+            lines.append(_format_sample(name + '_count', labels, count))
+        for name, kind, labels, value in samples:
+            metrics.setdefault((name, kind), []).append(
+                _format_sample(name, _label_key(labels), value))
+
+        output = []
+        for (name, kind), lines in metrics.items():
+            output.append('# TYPE %s %s' % (name, kind))
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+    def reset(self):
+        self.counters.reset()
+        with self._lock:
+            self._histograms.clear()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    # Label values may come from requests: a raw newline would end the sample
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        name += '{%s}' % ','.join(
+            '%s="%s"' % (label, _escape_label(label_value)) for label, label_value in labels)
+    return '%s %s' % (name, value)
@@ -0,0 +1,95 @@
+import base64
+import hashlib
+import hmac
+import math
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+def plan_parts(length, part_size):
+    """Split a file into upload parts.
+
+    The part size is raised to S3's 5MB minimum, and as needed to stay within
+    10000 parts.
+
+    :return: list of (part number, offset, length) tuples
+    """
+    part_size = max(part_size, MIN_PART_SIZE, int(math.ceil(length / float(MAX_PARTS))))
+    count = max(1, int(math.ceil(length / float(part_size))))
+    return [(number + 1, number * part_size, min(part_size, length - number * part_size))
+            for number in range(count)]
+
+
+def upload_token(secret, bucket, key, upload_id, owner):
+    """Sign the identity of a multipart upload, binding it to its owner.
+
+    Clients must present the token to complete or abort the upload.
+    """
+    message = '\n'.join([bucket, key, upload_id, owner]).encode('utf-8')
+    return hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def check_upload_token(secret, bucket, key, upload_id, owner, token):
+    expected = upload_token(secret, bucket, key, upload_id, owner)
+    return hmac.compare_digest(expected, token or '')
+
+
+def start(s3, signer, bucket, key, acl, content_type, length, part_size, expires_in, md5=None):
+    """Create a multipart upload and presign an UploadPart URL for each part.
+
+    Unfinished uploads of the same key (e.g. from a retried authorize) are
+    aborted first, so their parts don't stay stored. The declared `md5` is
+    kept in the object metadata for `verify_md5`.
+    """
+    abort_pending(s3, bucket, key)
+    upload = s3.create_multipart_upload(
+        Bucket=bucket, Key=key, ACL=acl, ContentType=content_type,
+        Metadata={'md5': md5} if md5 else {})
+    upload_id = upload['UploadId']
+    parts = []
+    for number, offset, size in plan_parts(length, part_size):
+        parts.append({
+            'part_number': number,
+            'offset': offset,
+            'length': size,
+            'upload_url': signer.generate_presigned_url(
+                ClientMethod='upload_part',
+                Params={
+                    'Bucket': bucket,
+                    'Key': key,
+                    'UploadId': upload_id,
+                    'PartNumber': number
+                },
+                ExpiresIn=expires_in),
+        })
+    return upload_id, parts
+
+
+def abort_pending(s3, bucket, key):
+    """Abort the unfinished multipart uploads of a key.
+    """
+    paginator = s3.get_paginator('list_multipart_uploads')
+    for page in paginator.paginate(Bucket=bucket, Prefix=key):
+        for upload in page.get('Uploads', []):
+            if upload['Key'] == key:
+                s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload['UploadId'])
+
+
+def verify_md5(s3, bucket, key, chunk_size=1024 * 1024):
+    """Check a completed upload against the md5 declared when it was started.
+
+    Multipart ETags are not the md5 of the content, so the object is read
+    back and hashed.
+    :return: False if the content doesn't match, True otherwise (also when
+        no md5 was declared)
+    """
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    expected = obj.get('Metadata', {}).get('md5')
+    if not expected:
+        obj['Body'].close()
+        return True
+    digest = hashlib.md5()
+    for chunk in iter(lambda: obj['Body'].read(chunk_size), b''):
+        digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode('ascii') == expected
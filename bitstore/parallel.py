@@ -0,0 +1,53 @@
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WorkerPool(object):
+    """Process-wide thread pool shared by all requests.
+
+    Each call to `imap` keeps at most `max_inflight` tasks queued at a time,
+    so a single large request can only occupy part of the pool.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def imap(self, func, items, max_inflight=None):
+        """Apply `func` to each item in the pool, yielding in input order.
+
+        :return: iterator of (item, result, exception) tuples; exception is
+            None on success and result is None on failure
+        """
+        executor = self._get_executor()
+        max_inflight = max(1, max_inflight or self.max_workers)
+        pending = collections.deque()
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= max_inflight:
+                yield self._collect(*pending.popleft())
+        while pending:
+            yield self._collect(*pending.popleft())
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='bitstore-worker')
+            return self._executor
+
+    @staticmethod
+    def _collect(item, future):
+        try:
+            return item, future.result(), None
+        except Exception as exception: # noqa
+            return item, None, exception
@@ -0,0 +1,117 @@
+import base64
+import functools
+import os
+import string
+
+
+def _md5_hex(file, path):
+    try:
+        return base64.b64decode(file['md5']).hex()
+    except Exception:
+        return file['md5_hex']
+
+
+# Fields computed from the file path and info, on top of the file info itself
+DERIVED_FIELDS = {
+    'path': lambda file, path: path,
+    'basename': lambda file, path: os.path.basename(path),
+    'dirname': lambda file, path: os.path.dirname(path),
+    'extension': lambda file, path: os.path.splitext(path)[1],
+    'md5_hex': _md5_hex,
+}
+
+
+def _make_getter(name):
+    """Return the function computing a field from (file, path, owner, dataset).
+    """
+    if name == 'owner':
+        return lambda file, path, owner, dataset: owner
+    if name == 'dataset':
+        return lambda file, path, owner, dataset: dataset
+    if name in DERIVED_FIELDS:
+        derive = DERIVED_FIELDS[name]
+        return lambda file, path, owner, dataset: derive(file, path)
+    return lambda file, path, owner, dataset: file[name]
+
+
+class PathPattern(object):
+    """A parsed STORAGE_PATH_PATTERN.
+
+    The pattern is validated once and formatting only computes the fields it
+    actually references.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.fields = []
+        try:
+            self._parsed = parsed = list(string.Formatter().parse(pattern))
+        except ValueError as e:
+            raise ValueError('Invalid STORAGE_PATH_PATTERN %r: %s' % (pattern, e))
+        for _, field_name, _, conversion in parsed:
+            if field_name is None:
+                continue
+            name = field_name.split('.', 1)[0].split('[', 1)[0]
+            if not name or name.isdigit():
+                raise ValueError(
+                    'Invalid STORAGE_PATH_PATTERN %r: positional fields are not supported' % pattern)
+            if conversion not in (None, 'r', 's', 'a'):
+                raise ValueError(
+                    'Invalid STORAGE_PATH_PATTERN %r: unknown conversion %r' % (pattern, conversion))
+            if name not in self.fields:
+                self.fields.append(name)
+        # Check format specs, indexes and attributes against values of the
+        # right type: an int length and strings for the other fields
+        samples = dict((name, 0 if name == 'length' else '0' * 32) for name in self.fields)
+        try:
+            pattern.format_map(samples)
+        except (AttributeError, IndexError, TypeError, ValueError) as e:
+            raise ValueError('Invalid STORAGE_PATH_PATTERN %r: %s' % (pattern, e))
+        self._getters = [(name, _make_getter(name)) for name in self.fields]
+
+    @property
+    def content_addressed(self):
+        """Whether keys are derived from the file's md5.
+        """
+        return 'md5' in self.fields or 'md5_hex' in self.fields
+
+    def dataset_prefix(self, owner, dataset):
+        """Return the key prefix shared by all files of a dataset.
+
+        That is the start of the pattern up to its first field other than
+        {owner} and {dataset}, cut after the last '/'. Returns None unless both
+        of them are in it, as the prefix would not be specific to the dataset.
+        """
+        prefix = ''
+        field_ends = {}
+        for literal, field_name, format_spec, conversion in self._parsed:
+            prefix += literal
+            if field_name is None:
+                continue
+            if field_name not in ('owner', 'dataset'):
+                break
+            field = '{%s%s%s}' % (field_name,
+                                  '!' + conversion if conversion else '',
+                                  ':' + format_spec if format_spec else '')
+            prefix += field.format(owner=owner, dataset=dataset)
+            field_ends[field_name] = len(prefix)
+        prefix = prefix[:prefix.rfind('/') + 1]
+        if set(field_ends) != set(['owner', 'dataset']) or \
+                max(field_ends.values()) > len(prefix):
+            return None
+        return prefix
+
+    def format(self, file, owner, dataset, path):
+        try:
+            params = dict((name, get(file, path, owner, dataset)) for name, get in self._getters)
+        except KeyError as e:
+            msg = ('STORAGE_PATH_PATTERN contains variable not found in file info: %s' % e)
+            raise ValueError(msg)
+        return self.pattern.format_map(params)
+
+
+@functools.lru_cache(maxsize=16)
+def compile_pattern(pattern):
+    """Return the (cached) PathPattern for a pattern string.
+    """
+    return PathPattern(pattern)
@@ -0,0 +1,35 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import cache
+
+
+class Prober(object):
+    """Finds out whether a URL is publicly readable or needs a signature.
+
+    HEAD requests go through a pooled keep-alive session with a timeout and
+    their outcome is cached, with separate TTLs for public and private
+    (403) answers.
+    """
+
+    def __init__(self, timeout=5, cache_size=4096, public_ttl=300, private_ttl=3600,
+                 pool_size=10):
+        self.timeout = timeout
+        self.public_ttl = public_ttl
+        self.private_ttl = private_ttl
+        self.cache = cache.LRUCache(cache_size)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def needs_signing(self, url):
+        """Return True if anonymous access to the URL is forbidden.
+        """
+        needs_signing = self.cache.get(url)
+        if needs_signing is None:
+            response = self.session.head(url, timeout=self.timeout)
+            needs_signing = response.status_code == 403
+            self.cache.set(url, needs_signing,
+                           self.private_ttl if needs_signing else self.public_ttl)
+        return needs_signing
@@ -0,0 +1,87 @@
+import bisect
+import functools
+import hashlib
+
+
+class Shard(object):
+    """A bucket, possibly on its own S3-compatible endpoint.
+    """
+
+    def __init__(self, bucket, endpoint_url=None):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+
+    @property
+    def name(self):
+        if self.endpoint_url:
+            return '%s/%s' % (self.endpoint_url, self.bucket)
+        return self.bucket
+
+    def __eq__(self, other):
+        return isinstance(other, Shard) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return 'Shard(%r)' % self.name
+
+
+class HashRing(object):
+    """Consistent hash ring mapping keys onto shards.
+
+    Each shard is placed at `vnodes` points of the ring and a key belongs to
+    the first point following its hash, so adding or removing a shard only
+    moves about 1/N of the keys.
+    """
+
+    def __init__(self, shards, vnodes=64):
+        if not shards:
+            raise ValueError('A hash ring needs at least one shard')
+        self.shards = list(shards)
+        points = sorted(
+            (_hash('%s#%d' % (shard.name, i)), shard)
+            for shard in self.shards for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def get(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._shards[index]
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+def parse_shards(value):
+    """Parse a STORAGE_SHARDS setting.
+
+    A comma separated list of bucket names, each optionally prefixed by the
+    URL of its endpoint, e.g. `bucket-a,bucket-b,http://minio-2:9000/bucket-c`.
+    """
+    shards = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if '://' in entry:
+            endpoint_url, _, bucket = entry.rstrip('/').rpartition('/')
+            if '://' not in endpoint_url or not bucket:
+                raise ValueError('Invalid STORAGE_SHARDS entry: %r' % entry)
+            shards.append(Shard(bucket, endpoint_url))
+        else:
+            shards.append(Shard(entry))
+    if len(set(shard.bucket for shard in shards)) != len(shards):
+        raise ValueError('STORAGE_SHARDS has duplicate buckets')
+    return shards
+
+
+@functools.lru_cache(maxsize=4)
+def get_ring(value, vnodes=64):
+    """Return the (cached) HashRing for a STORAGE_SHARDS setting, or None if empty.
+    """
+    shards = parse_shards(value or '')
+    if not shards:
+        return None
+    return HashRing(shards, vnodes)
@@ -0,0 +1,189 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+
+try:
+    from urllib.parse import quote, urlsplit
+except ImportError:
+    from urllib import quote
+    from urlparse import urlsplit
+
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+ISO8601 = '%Y-%m-%dT%H:%M:%SZ'
+SIGV4_TIMESTAMP = '%Y%m%dT%H%M%SZ'
+
+
+class Signer(object):
+    """Lightweight SigV4 presigner for S3.
+
+    Produces the same POST policies and presigned URLs as the boto3
+    client it is built from (path-style addressing), but without going
+    through botocore's request pipeline. The derived signing key is cached
+    per (secret, date), so each signature costs a single HMAC.
+
+    The signer mimics the parts of the boto3 client interface used by the
+    controllers, so either can be passed around.
+    """
+
+    service = 's3'
+
+    def __init__(self, credentials, region_name, endpoint_url):
+        self.credentials = credentials
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.host = _host_from_url(self.endpoint_url)
+        self.scope_suffix = '/%s/%s/aws4_request' % (region_name, self.service)
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_client(cls, client):
+        """Create a signer sharing the credentials and endpoint of a boto3 client.
+        """
+        return cls(client._request_signer._credentials,
+                   client.meta.region_name,
+                   client.meta.endpoint_url)
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None,
+                                ExpiresIn=3600, now=None):
+        """Same as `boto3 S3.Client.generate_presigned_post`.
+        """
+        now = now or _utcnow()
+        credentials = self.credentials.get_frozen_credentials()
+        timestamp = now.strftime(SIGV4_TIMESTAMP)
+        credential = credentials.access_key + '/' + timestamp[:8] + self.scope_suffix
+
+        fields = dict(Fields or {})
+        conditions = list(Conditions or [])
+        conditions.append({'bucket': Bucket})
+        if Key.endswith('${filename}'):
+            conditions.append(['starts-with', '$key', Key[:-len('${filename}')]])
+        else:
+            conditions.append({'key': Key})
+        fields['key'] = Key
+
+        fields['x-amz-algorithm'] = ALGORITHM
+        fields['x-amz-credential'] = credential
+        fields['x-amz-date'] = timestamp
+        conditions.append({'x-amz-algorithm': ALGORITHM})
+        conditions.append({'x-amz-credential': credential})
+        conditions.append({'x-amz-date': timestamp})
+        if credentials.token is not None:
+            fields['x-amz-security-token'] = credentials.token
+            conditions.append({'x-amz-security-token': credentials.token})
+
+        expiration = now + datetime.timedelta(seconds=ExpiresIn)
+        policy = {'expiration': expiration.strftime(ISO8601), 'conditions': conditions}
+        fields['policy'] = base64.b64encode(
+            json.dumps(policy).encode('utf-8')).decode('utf-8')
+        fields['x-amz-signature'] = self._sign(
+            credentials.secret_key, timestamp[:8], fields['policy'])
+
+        return {'url': '%s/%s' % (self.endpoint_url, Bucket), 'fields': fields}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600,
+                               HttpMethod=None, now=None):
+        """Same as `boto3 S3.Client.generate_presigned_url`.
+
+        Supports `get_object` and `upload_part`.
+        """
+        if ClientMethod == 'get_object':
+            method, params = 'GET', None
+        elif ClientMethod == 'upload_part':
+            method, params = 'PUT', [('uploadId', Params['UploadId']),
+                                     ('partNumber', Params['PartNumber'])]
+        else:
+            raise ValueError('Unsupported client method: %s' % ClientMethod)
+        return self.presign_url(
+            HttpMethod or method, Params['Bucket'], Params['Key'], ExpiresIn,
+            params=params, now=now)
+
+    def presign_url(self, method, bucket, key, expires_in, params=None, now=None):
+        """Build a presigned path-style URL with a query-string signature.
+
+        :param params: operation query parameters, in the order the boto3
+            serializer would emit them
+        """
+        now = now or _utcnow()
+        credentials = self.credentials.get_frozen_credentials()
+        timestamp = now.strftime(SIGV4_TIMESTAMP)
+
+        path = '/%s/%s' % (bucket, quote(key, safe='/~'))
+        query = [(name, value) for name, value in (params or [])]
+        query.extend([
+            ('X-Amz-Algorithm', ALGORITHM),
+            ('X-Amz-Credential', credentials.access_key + '/' + timestamp[:8] + self.scope_suffix),
+            ('X-Amz-Date', timestamp),
+            ('X-Amz-Expires', expires_in),
+            ('X-Amz-SignedHeaders', 'host'),
+        ])
+        if credentials.token is not None:
+            query.append(('X-Amz-Security-Token', credentials.token))
+        encoded = ['%s=%s' % (_encode(name), _encode(value)) for name, value in query]
+        query_string = '&'.join(encoded)
+
+        canonical_request = '\n'.join([
+            method,
+            _base_path(self.endpoint_url) + path,
+            '&'.join(sorted(encoded)),
+            'host:%s\n' % self.host,
+            'host',
+            UNSIGNED_PAYLOAD,
+        ])
+        string_to_sign = '\n'.join([
+            ALGORITHM,
+            timestamp,
+            timestamp[:8] + self.scope_suffix,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+        ])
+        signature = self._sign(credentials.secret_key, timestamp[:8], string_to_sign)
+        return '%s%s?%s&X-Amz-Signature=%s' % (
+            self.endpoint_url, path, query_string, signature)
+
+    def signing_key(self, secret_key, date):
+        """Return the SigV4 signing key for the date, deriving it once per day.
+        """
+        cache_key = (secret_key, date)
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = _hmac(('AWS4' + secret_key).encode('utf-8'), date)
+            key = _hmac(key, self.region_name)
+            key = _hmac(key, self.service)
+            key = _hmac(key, 'aws4_request')
+            with self._lock:
+                # Keys for past days are never needed again
+                self._keys = {cache_key: key}
+        return key
+
+    def _sign(self, secret_key, date, string_to_sign):
+        key = self.signing_key(secret_key, date)
+        return hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def _encode(value):
+    return quote(str(value), safe='-_.~')
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def _base_path(url):
+    return urlsplit(url).path.rstrip('/')
+
+
+def _host_from_url(url):
+    parts = urlsplit(url)
+    default_ports = {'http': 80, 'https': 443}
+    if parts.port is not None and parts.port != default_ports.get(parts.scheme):
+        return '%s:%d' % (parts.hostname, parts.port)
+    return parts.hostname
@@ -0,0 +1,75 @@
+import collections
+import threading
+
+from . import metrics
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls doing the same work.
+
+    While a call for a (name, key) is running, other callers for the same
+    (name, key) wait for it and get its result (or exception) instead of
+    repeating it. Nothing is cached once the call returns.
+
+    `stats` counts, per name, the calls `executed` and those `shared` with an
+    in-flight call; the most recently coalesced keys keep their own count.
+    """
+
+    def __init__(self, max_keys=1024):
+        self.max_keys = max_keys
+        self.stats = metrics.Counters()
+        self._calls = {}
+        self._saved = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, name, key, func, *args, **kwargs):
+        flight = (name, key)
+        with self._lock:
+            call = self._calls.get(flight)
+            leader = call is None
+            if leader:
+                call = self._calls[flight] = _Call()
+            else:
+                self._saved[flight] = self._saved.pop(flight, 0) + 1
+                if len(self._saved) > self.max_keys:
+                    self._saved.popitem(last=False)
+
+        if not leader:
+            self.stats.inc(name + '.shared')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        self.stats.inc(name + '.executed')
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[flight]
+            call.done.set()
+
+    def saved(self, limit=10):
+        """Return the keys which were shared the most, as (name, key, count).
+        """
+        with self._lock:
+            items = list(self._saved.items())
+        items.sort(key=lambda item: item[1], reverse=True)
+        return [(name, key, count) for (name, key), count in items[:limit]]
+
+    def reset(self):
+        self.stats.reset()
+        with self._lock:
+            self._saved.clear()
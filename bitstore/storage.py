@@ -0,0 +1,77 @@
+import logging
+import threading
+
+from . import sigv4
+
+
+_clients = {}
+_signers = {}
+_lock = threading.Lock()
+
+
+def get_client(access_key_id, secret_access_key, bucket,
+               endpoint_url=None, max_pool_connections=10, instrument=None):
+    """Return the shared S3 client for the given connection settings.
+
+    Clients are created lazily, once per (endpoint, credentials, bucket),
+    and reused by every request afterwards. boto3 clients are thread safe,
+    so a single client (and its connection pool) serves all worker threads.
+
+    :param instrument: called with each newly created client
+    """
+    key = (endpoint_url, access_key_id, secret_access_key, bucket)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # boto3 takes a while to import, only pay for it when needed
+            import boto3
+            from botocore.client import Config
+            client = boto3.client(
+                's3',
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+                endpoint_url=endpoint_url,
+                config=Config(signature_version='s3v4',
+                              s3={'addressing_style': 'path'},
+                              max_pool_connections=max_pool_connections)
+            )
+            if instrument is not None:
+                instrument(client)
+            if endpoint_url:
+                bootstrap_bucket(client, bucket)
+            _clients[key] = client
+    return client
+
+
+def bootstrap_bucket(client, bucket):
+    """Make sure the bucket exists and is publicly readable.
+
+    Only used with custom (S3-compatible) endpoints, where the bucket is not
+    provisioned out of band. Runs once per pooled client.
+    """
+    try:
+        client.create_bucket(Bucket=bucket)
+        client.put_bucket_acl(Bucket=bucket, ACL='public-read')
+    except: # noqa
+        logging.exception('Failed to create the bucket')
+
+
+def get_signer(client):
+    """Return the native SigV4 signer sharing the settings of a pooled client.
+    """
+    signer = _signers.get(client)
+    if signer is None:
+        with _lock:
+            signer = _signers.setdefault(client, sigv4.Signer.from_client(client))
+    return signer
+
+
+def reset():
+    """Drop all pooled clients and signers (used by tests).
+    """
+    with _lock:
+        _clients.clear()
+        _signers.clear()
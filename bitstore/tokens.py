@@ -0,0 +1,71 @@
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+
+from . import cache
+
+
+class CachingVerifyer(object):
+    """Caches the permissions extracted from verified tokens.
+
+    Wraps an `auth.lib.Verifyer`. Entries are keyed by a hash of the token,
+    never outlive the token's own `exp` claim and are dropped when the auth
+    server's public key changes. The public key can be kept up to date by a
+    background thread, so requests never wait for it to be fetched.
+    """
+
+    def __init__(self, verifyer, auth_endpoint=None, maxsize=10000, ttl=300):
+        self.verifyer = verifyer
+        self.auth_endpoint = auth_endpoint
+        self.public_key = None
+        self.ttl = ttl
+        self.cache = cache.LRUCache(maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def extract_permissions(self, auth_token):
+        if not auth_token:
+            return self.verifyer.extract_permissions(auth_token)
+        key = hashlib.sha256(auth_token.encode('utf-8')).hexdigest()
+        permissions = self.cache.get(key)
+        if permissions is None:
+            permissions = self.verifyer.extract_permissions(auth_token)
+            if permissions:
+                ttl = self.ttl
+                if permissions.get('exp') is not None:
+                    ttl = min(ttl, permissions['exp'] - time.time())
+                self.cache.set(key, permissions, ttl)
+        return permissions
+
+    def refresh_public_key(self):
+        """Fetch the auth server's public key and switch to it if it changed.
+        """
+        response = requests.get(self.auth_endpoint, timeout=10)
+        response.raise_for_status()
+        public_key = response.text
+        if public_key != self.public_key:
+            self.verifyer = type(self.verifyer)(public_key=public_key)
+            self.public_key = public_key
+            self.cache.invalidate()
+            logging.info('Loaded auth public key from %s', self.auth_endpoint)
+
+    def start_background_refresh(self, interval):
+        """Refresh the public key every `interval` seconds in a daemon thread.
+        """
+        def run():
+            while True:
+                try:
+                    self.refresh_public_key()
+                except Exception: # noqa
+                    logging.exception('Failed to refresh the auth public key')
+                if self._stop.wait(interval):
+                    return
+
+        self._thread = threading.Thread(target=run, name='bitstore-auth-key', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
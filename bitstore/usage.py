@@ -0,0 +1,79 @@
+import threading
+import time
+
+from . import cache
+
+
+class UsageCache(object):
+    """Per-owner storage totals served from memory.
+
+    Totals are read from the registry with `get_total_size_for_owner` on a
+    miss and reused for `ttl` seconds, so a quota decision is never based on
+    data older than that. Call `invalidate` when an owner's files change.
+
+    The age of the totals served is tracked as a running sum and a maximum
+    over the last one to two `max_window` seconds.
+    """
+
+    def __init__(self, ttl=30, maxsize=10000, clock=time.monotonic, max_window=60):
+        self.ttl = ttl
+        self.clock = clock
+        self.max_window = max_window
+        self.cache = cache.LRUCache(maxsize, clock=clock)
+        self.served = 0
+        self.served_age_sum = 0.0
+        self._window_start = clock()
+        self._window_max = 0.0
+        self._previous_max = 0.0
+        self._lock = threading.Lock()
+
+    def get_total_size(self, registry, owner, findability=None):
+        """Return the total size of the owner's files with the given findability.
+        """
+        key = (owner, findability)
+        entry = self.cache.get(key)
+        now = self.clock()
+        if entry is None:
+            entry = (registry.get_total_size_for_owner(owner, findability), now)
+            self.cache.set(key, entry, self.ttl)
+        total, fetched_at = entry
+        age = now - fetched_at
+        with self._lock:
+            self._roll(now)
+            self.served += 1
+            self.served_age_sum += age
+            self._window_max = max(self._window_max, age)
+        return total
+
+    def _roll(self, now):
+        elapsed = now - self._window_start
+        if elapsed >= self.max_window:
+            self._previous_max = self._window_max if elapsed < 2 * self.max_window else 0.0
+            self._window_max = 0.0
+            self._window_start = now
+
+    @property
+    def served_age_max(self):
+        """Largest age of the totals served in the last `max_window` seconds (at least).
+        """
+        with self._lock:
+            self._roll(self.clock())
+            return max(self._window_max, self._previous_max)
+
+    def invalidate(self, owner=None):
+        """Forget the totals of an owner, or of everybody.
+        """
+        if owner is None:
+            self.cache.invalidate()
+        else:
+            self.cache.invalidate(predicate=lambda key: key[0] == owner)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats.update({
+            'ttl': self.ttl,
+            'served': self.served,
+            'served_age_avg': self.served_age_sum / self.served if self.served else 0.0,
+            'served_age_max': self.served_age_max,
+        })
+        return stats
@@ -0,0 +1,26 @@
+"""Gunicorn settings for serving bitstore: `gunicorn -c gunicorn.conf.py server:app`.
+
+The application is imported once in the master (`preload_app`), then forked
+into `GUNICORN_WORKERS` workers of `GUNICORN_THREADS` threads. Clients,
+pools and background threads are only created in the workers, after the
+fork.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:%s' % os.environ.get('PORT', '8000'))
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = 'gthread'
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes', 'on')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+if preload_app:
+    # Nothing to initialise in the master, the workers start their services
+    os.environ.setdefault('INIT_MODE', 'lazy')
+
+
+def post_fork(server, worker):
+    from bitstore.blueprint import start_services
+    start_services()
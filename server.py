@@ -32,5 +32,20 @@ app.register_blueprint(make_blueprint(),
 
 logging.getLogger().setLevel(logging.INFO)
 
+def serve():
+    """Serve with preforked gunicorn workers if available, else with the
+    (threaded) development server.
+    """
+    try:
+        import gunicorn # noqa
+    except ImportError:
+        logging.warning('gunicorn is not installed, using the development server')
+        app.run(threaded=True)
+        return
+    app_path = os.path.dirname(os.path.abspath(__file__))
+    config = os.path.join(app_path, 'gunicorn.conf.py')
+    os.execvp('gunicorn', ['gunicorn', '-c', config, '--chdir', app_path, 'server:app'])
+
+
 if __name__=='__main__':
-    app.run()
+    serve()
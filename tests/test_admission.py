@@ -0,0 +1,96 @@
+import unittest
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+from importlib import import_module
+module = import_module('bitstore.admission')
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class AdmissionControlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    # Helpers
+
+    def make(self, **policy):
+        return module.AdmissionControl({'authorize': module.Policy(**policy)}, clock=self.clock)
+
+    # Tests
+
+    def test__admit__rate_limits_by_cost(self):
+        control = self.make(rate=10, burst=100)
+        control.admit('authorize', 'owner', 60).release()
+        with self.assertRaises(module.Throttled) as error:
+            control.admit('authorize', 'owner', 60)
+        self.assertEqual(error.exception.reason, 'rate')
+        self.assertAlmostEqual(error.exception.retry_after, 2)
+        self.assertEqual(module.retry_after_header(error.exception), '2')
+        # other owners have their own budget
+        control.admit('authorize', 'other', 60).release()
+        self.clock.now = 2
+        control.admit('authorize', 'owner', 60).release()
+        self.assertEqual(control.stats.snapshot(), {
+            'authorize.admitted': 3, 'authorize.admitted_cost': 180,
+            'authorize.throttled': 1, 'authorize.throttled_cost': 60,
+        })
+
+    def test__admit__caps_cost_to_burst(self):
+        control = self.make(rate=10, burst=100)
+        control.admit('authorize', 'owner', 50000).release()
+        with self.assertRaises(module.Throttled) as error:
+            control.admit('authorize', 'owner', 50000)
+        self.assertAlmostEqual(error.exception.retry_after, 10)
+
+    def test__admit__caps_concurrency(self):
+        control = self.make(max_concurrent=2)
+        first = control.admit('authorize', 'owner', 1000)
+        second = control.admit('authorize', 'owner')
+        with self.assertRaises(module.Throttled) as error:
+            control.admit('authorize', 'owner')
+        self.assertEqual(error.exception.reason, 'concurrency')
+        first.release()
+        first.release()
+        control.admit('authorize', 'owner')
+        with self.assertRaises(module.Throttled):
+            control.admit('authorize', 'owner')
+        second.release()
+
+    def test__ticket__deferred_until_response_is_closed(self):
+        control = self.make(max_concurrent=1)
+        ticket = control.admit('authorize', 'owner')
+        response = Mock()
+        self.assertIs(ticket.defer(response), response)
+        ticket.release()
+        with self.assertRaises(module.Throttled):
+            control.admit('authorize', 'owner')
+        response.call_on_close.call_args[0][0]()
+        control.admit('authorize', 'owner')
+
+    def test__admit__unlimited_endpoints(self):
+        control = self.make(rate=1)
+        for _ in range(10):
+            control.admit('presign', 'owner').release()
+        self.assertEqual(control.stats.snapshot(), {})
+
+    def test__policies_from_config(self):
+        policies = module.policies_from_config({
+            'ADMISSION_AUTHORIZE_RATE': '1000',
+            'ADMISSION_AUTHORIZE_BURST': '50000',
+            'ADMISSION_PRESIGN_CONCURRENCY': '4',
+        }, ['authorize', 'presign', 'presign_bulk'])
+        self.assertEqual(sorted(policies), ['authorize', 'presign'])
+        self.assertEqual((policies['authorize'].rate, policies['authorize'].burst), (1000, 50000))
+        self.assertEqual((policies['presign'].rate, policies['presign'].max_concurrent), (0, 4))
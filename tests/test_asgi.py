@@ -0,0 +1,182 @@
+import asyncio
+import json
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+from flask import Flask
+from flask_cors import CORS
+from moto import mock_s3_deprecated
+import boto3
+
+import auth
+from filemanager.models import FileManager
+from importlib import import_module
+module = import_module('bitstore.asgi')
+blueprint = import_module('bitstore.blueprint')
+controllers = import_module('bitstore.controllers')
+tokens = import_module('bitstore.tokens')
+
+from .test_controllers import PAYLOAD, generate_token, public_key
+
+
+def call(app, method, path, query=b'', headers=(), body=b'', chunk_size=None):
+    """Run a request through an ASGI app, returning (status, headers, [body chunks]).
+    """
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] \
+        if chunk_size and body else [body]
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(name.encode(), value.encode()) for name, value in headers]}
+    asyncio.run(app(scope, receive, send))
+    start = sent[0]
+    return (start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']),
+            [message['body'] for message in sent[1:]])
+
+
+class AsgiTest(unittest.TestCase):
+
+    # Actions
+
+    def setUp(self):
+        self.addCleanup(patch.stopall)
+        controllers.reset_state()
+        self.original_config = dict(controllers.config)
+        controllers.config['STORAGE_BUCKET_NAME'] = self.bucket = 'buckbuck'
+        controllers.config['STORAGE_ACCESS_KEY_ID'] = ''
+        controllers.config['STORAGE_SECRET_ACCESS_KEY'] = ''
+        controllers.config['STORAGE_PATH_PATTERN'] = '{owner}/{dataset}/{path}'
+        registry = FileManager('sqlite://')
+        registry.init_db()
+        self.mock = mock_s3_deprecated()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        boto3.client('s3').create_bucket(Bucket=self.bucket)
+        patch.dict('os.environ', {'INIT_MODE': 'blocking', 'AUTH_PUBLIC_KEY_REFRESH_INTERVAL': '0'}).start()
+        patch.object(blueprint, 'make_verifyer',
+                     return_value=tokens.CachingVerifyer(auth.lib.Verifyer(public_key=public_key))).start()
+        patch.object(blueprint, 'make_file_manager', return_value=registry).start()
+        flask_app = Flask(__name__)
+        CORS(flask_app, supports_credentials=True)
+        flask_app.register_blueprint(blueprint.make_blueprint(), url_prefix='/rawstore/')
+        self.app = module.App(flask_app, max_threads=4)
+        self.addCleanup(self.app.executor.shutdown)
+
+    def tearDown(self):
+        controllers.config = self.original_config
+
+    # Tests
+
+    def test__authorize__same_response_as_controller(self):
+        status, headers, body = call(
+            self.app, 'POST', '/rawstore/authorize', headers=[('Auth-Token', generate_token())],
+            body=json.dumps(PAYLOAD).encode(), chunk_size=7)
+        self.assertEqual(status, 200)
+        output = json.loads(b''.join(body))
+        entry = output['filedata']['data/file1.xls']
+        self.assertEqual(entry['upload_query']['key'], 'owner/name/data/file1.xls')
+        self.assertFalse(entry['exists'])
+
+    def test__authorize__streamed(self):
+        controllers.config['AUTHORIZE_STREAM_THRESHOLD'] = '1'
+        status, headers, body = call(
+            self.app, 'POST', '/rawstore/authorize', query=b'jwt=' + generate_token().encode(),
+            body=json.dumps(PAYLOAD).encode())
+        self.assertEqual(status, 200)
+        self.assertGreater(len(body), 2)
+        self.assertIn('data/file1.xls', json.loads(b''.join(body))['filedata'])
+
+    def test__authorize__rejects_bad_requests(self):
+        status, _, _ = call(self.app, 'POST', '/rawstore/authorize',
+                            headers=[('Auth-Token', generate_token())], body=b'{"filedata": [')
+        self.assertEqual(status, 400)
+        self.app.max_body_bytes = 10
+        status, _, _ = call(self.app, 'POST', '/rawstore/authorize',
+                            headers=[('Auth-Token', generate_token())],
+                            body=json.dumps(PAYLOAD).encode())
+        self.assertEqual(status, 413)
+
+    def test__info__conditional(self):
+        token = generate_token('12345678')
+        status, headers, body = call(self.app, 'GET', '/rawstore/info', headers=[('Auth-Token', token)])
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(b''.join(body))['prefixes'][0], 'http://buckbuck:80/12345678')
+        status, _, _ = call(self.app, 'GET', '/rawstore/info',
+                            headers=[('Auth-Token', token), ('If-None-Match', headers['etag'])])
+        self.assertEqual(status, 304)
+
+    def test__routing__is_the_flask_apps(self):
+        self.assertEqual(call(self.app, 'GET', '/rawstore/nope')[0], 404)
+        self.assertEqual(call(self.app, 'GET', '/other/info')[0], 404)
+        self.assertEqual(call(self.app, 'GET', '/rawstore/authorize')[0], 405)
+
+    def test__cors(self):
+        status, headers, _ = call(self.app, 'OPTIONS', '/rawstore/presign', headers=[
+            ('Origin', 'https://datahub.io'), ('Access-Control-Request-Method', 'GET'),
+            ('Access-Control-Request-Headers', 'auth-token')])
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['access-control-allow-origin'], 'https://datahub.io')
+        self.assertEqual(headers['access-control-allow-credentials'], 'true')
+        status, headers, _ = call(self.app, 'GET', '/rawstore/info', headers=[
+            ('Origin', 'https://datahub.io'), ('Auth-Token', generate_token())])
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['access-control-allow-origin'], 'https://datahub.io')
+
+    def test__ready(self):
+        status, _, body = call(self.app, 'GET', '/rawstore/ready')
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(b''.join(body))['components']['storage'])
+
+    def test__rejects_requests_over_max_pending(self):
+        self.app.pending = self.app.max_pending
+        status, headers, _ = call(self.app, 'GET', '/rawstore/info',
+                                  headers=[('Auth-Token', generate_token())])
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['retry-after'], '1')
+
+
+class WsgiAdapterTest(unittest.TestCase):
+
+    def test__streams_and_closes_responses(self):
+        closed = []
+        start_response = []
+
+        class Result(object):
+            def __iter__(self):
+                # Start the response with the first chunk, as generators may
+                start_response[0]('201 Created', [('X-Test', 'yes')])
+                yield b'a'
+                yield b''
+                yield b'b'
+
+            def close(self):
+                closed.append(True)
+
+        def wsgi_app(environ, response):
+            self.assertEqual(environ['PATH_INFO'], '/path')
+            self.assertEqual(environ['QUERY_STRING'], 'a=1')
+            self.assertEqual(environ['HTTP_AUTH_TOKEN'], 'token')
+            self.assertEqual(environ['CONTENT_LENGTH'], '4')
+            self.assertEqual(environ['wsgi.input'].read(), b'body')
+            start_response.append(response)
+            return Result()
+
+        app = module.App(wsgi_app, max_threads=2)
+        self.addCleanup(app.executor.shutdown)
+        status, headers, body = call(app, 'POST', '/path', query=b'a=1', body=b'body',
+                                     headers=[('Auth-Token', 'token'), ('Content-Length', '4')])
+        self.assertEqual(status, 201)
+        self.assertEqual(headers['x-test'], 'yes')
+        self.assertEqual(b''.join(body), b'ab')
+        self.assertEqual(closed, [True])
@@ -0,0 +1,82 @@
+import json
+import unittest
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+from flask import Flask
+
+from importlib import import_module
+module = import_module('bitstore.blueprint')
+init_storage = module.init_storage
+
+
+class ServicesTest(unittest.TestCase):
+
+    # Actions
+
+    def setUp(self):
+        self.addCleanup(patch.stopall)
+        self.verifyer = Mock(public_key='key')
+        self.make_verifyer = patch.object(module, 'make_verifyer', return_value=self.verifyer).start()
+        self.make_file_manager = patch.object(module, 'make_file_manager').start()
+        self.init_storage = patch.object(module, 'init_storage').start()
+        self.sleep = patch.object(module.time, 'sleep').start()
+
+    # Tests
+
+    def test__initialise__retries_failed_steps(self):
+        self.make_file_manager.side_effect = [Exception('database down'), Mock()]
+        services = module.Services()
+        self.assertFalse(services.status()['ready'])
+        services.initialise()
+        self.assertEqual(self.make_file_manager.call_count, 2)
+        self.sleep.assert_called_once_with(1)
+        status = services.status()
+        self.assertTrue(status['ready'])
+        self.assertEqual(status['components'], {'auth': True, 'database': True, 'storage': True})
+
+    def test__initialise__retries_failed_storage(self):
+        patch.dict(module.controllers.config, {
+            'STORAGE_PATH_PATTERN': '{owner}/{dataset}/{path}',
+            'STORAGE_BUCKET_NAME': 'buckbuck',
+            'STORAGE_ACCESS_KEY_ID': '',
+            'STORAGE_SECRET_ACCESS_KEY': '',
+        }).start()
+        get_s3_client = patch.object(module.controllers, 'get_s3_client',
+                                     side_effect=[Exception('storage down'), Mock()]).start()
+        patch.object(module.controllers, 'get_ring', return_value=None).start()
+        self.init_storage.side_effect = init_storage
+        services = module.Services()
+        services.initialise()
+        self.assertEqual(get_s3_client.call_count, 2)
+        self.assertTrue(services.status()['components']['storage'])
+
+    def test__start__raises_when_blocking(self):
+        self.init_storage.side_effect = Exception('bad storage')
+        with self.assertRaises(Exception):
+            module.Services().start(background=False)
+
+    def test__status__waits_for_auth_public_key(self):
+        self.verifyer.public_key = None
+        services = module.Services()
+        services.start(background=False)
+        self.assertEqual(services.status()['components']['auth'], False)
+        self.assertFalse(services.status()['ready'])
+
+    @patch.dict(module.os.environ, {'INIT_MODE': 'lazy', 'INIT_WAIT_TIMEOUT': '5'})
+    def test__ready__reports_readiness(self):
+        patch.dict(module.controllers.config, {'STORAGE_PATH_PATTERN': '{owner}/{dataset}/{path}'}).start()
+        app = Flask(__name__)
+        app.register_blueprint(module.make_blueprint(), url_prefix='/rawstore/')
+        client = app.test_client()
+        self.make_verifyer.assert_not_called()
+        out = client.get('/rawstore/ready')
+        self.assertEqual(out.status_code, 503)
+        self.assertFalse(json.loads(out.data.decode())['ready'])
+        # the first request starts the services and waits for them
+        client.get('/rawstore/info')
+        out = client.get('/rawstore/ready')
+        self.assertEqual(out.status_code, 200)
+        self.make_verifyer.assert_called_once_with()
@@ -0,0 +1,45 @@
+import unittest
+
+from importlib import import_module
+module = import_module('bitstore.cache')
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = module.LRUCache(2, clock=self.clock)
+
+    def test__get__expires_entries(self):
+        self.cache.set('a', 1, ttl=10)
+        self.clock.now = 9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats(), {'size': 0, 'maxsize': 2, 'hits': 1, 'misses': 1})
+
+    def test__set__evicts_least_recently_used(self):
+        self.cache.set('a', 1, ttl=10)
+        self.cache.set('b', 2, ttl=10)
+        self.cache.get('a')
+        self.cache.set('c', 3, ttl=10)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test__invalidate__by_key_and_predicate(self):
+        self.cache.set(('x', 1), 1, ttl=10)
+        self.cache.set(('y', 2), 2, ttl=10)
+        self.cache.invalidate(predicate=lambda key: key[0] == 'x')
+        self.assertIsNone(self.cache.get(('x', 1)))
+        self.cache.invalidate(('y', 2))
+        self.assertEqual(len(self.cache), 0)
@@ -1,7 +1,11 @@
+import base64
 import copy
 import datetime
+import hashlib
 import json
 import jwt
+import threading
+import time
 import unittest
 
 try:
@@ -11,6 +15,7 @@ except ImportError:
 from moto import mock_s3_deprecated
 import boto3
 import requests_mock
+from flask import Flask
 
 import auth
 from filemanager.models import FileManager
@@ -72,6 +77,7 @@ class DataStoreTest(unittest.TestCase):
 
         # Cleanup
         self.addCleanup(patch.stopall)
+        module.reset_state()
 
         # Request patch
         self.request = patch.object(module, 'request').start()
@@ -201,6 +207,378 @@ class DataStoreTest(unittest.TestCase):
         self.assertEqual(query['key'], 'owner/name/data/file1.xls')
         self.assertEqual(query['acl'], 'private')
 
+    @mock_s3_deprecated
+    def test___call___good_request_with_native_signer(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        module.config['STORAGE_SIGNER'] = 'native'
+        ret = module.authorize(generate_token(), PAYLOAD,
+                                auth.lib.Verifyer(public_key=public_key),
+                                full_registry(10, 10))
+        output = json.loads(ret)
+        filedata = output['filedata']['data/file1.xls']
+        self.assertEqual(filedata['upload_url'], 'https://s3.amazonaws.com/buckbuck')
+        self.assertEqual(filedata['upload_query']['key'], 'owner/name/data/file1.xls')
+        self.assertEqual(filedata['upload_query']['acl'], 'public-read')
+        self.assertTrue(filedata['upload_query']['x-amz-signature'])
+
+    @mock_s3_deprecated
+    def test___call___good_request_signed_in_parallel(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        module.config['AUTHORIZE_SIGNING_WORKERS'] = '4'
+        module.config['AUTHORIZE_PARALLEL_THRESHOLD'] = '1'
+        payload = copy.deepcopy(PAYLOAD)
+        paths = ['data/file%d.xls' % i for i in range(20)]
+        payload['filedata'] = {}
+        for path in paths:
+            payload['filedata'][path] = dict(PAYLOAD['filedata']['data/file1.xls'])
+        del payload['filedata']['data/file7.xls']['md5']
+        ret = module.authorize(generate_token(), payload,
+                                auth.lib.Verifyer(public_key=public_key),
+                                full_registry(10, 10))
+        output = json.loads(ret)
+        self.assertEqual(list(output['filedata']), paths)
+        for path in paths:
+            if path == 'data/file7.xls':
+                self.assertEqual(output['filedata'][path], {'error': "'md5'"})
+            else:
+                query = output['filedata'][path]['upload_query']
+                self.assertEqual(query['key'], 'owner/name/' + path)
+
+    @mock_s3_deprecated
+    def test___call___good_request_streamed(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        module.config['AUTHORIZE_STREAM_THRESHOLD'] = '1'
+        ret = module.authorize(generate_token(), PAYLOAD,
+                                auth.lib.Verifyer(public_key=public_key),
+                                full_registry(10, 10))
+        self.assertEqual(ret.mimetype, 'application/json')
+        output = json.loads(ret.get_data(as_text=True))
+        query = output['filedata']['data/file1.xls']['upload_query']
+        self.assertEqual(query['key'], 'owner/name/data/file1.xls')
+        self.assertFalse(output['filedata']['data/file1.xls']['exists'])
+
+    def test__stream_filedata__matches_json_dumps(self):
+        filedata = [('a.csv', {'exists': False, 'upload_query': {'key': 'x"y'}}),
+                    ('b/ü.csv', {'error': 'oops'})]
+        self.assertEqual(''.join(module.stream_filedata(filedata)),
+                         json.dumps({'filedata': dict(filedata)}))
+        self.assertEqual(''.join(module.stream_filedata([])), json.dumps({'filedata': {}}))
+
+    @mock_s3_deprecated
+    def test___call___multipart_upload(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        module.config['MULTIPART_THRESHOLD'] = '50'
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        payload = copy.deepcopy(PAYLOAD)
+        payload['filedata']['data/file1.xls']['md5'] = \
+            base64.b64encode(hashlib.md5(b'x' * 100).digest()).decode('ascii')
+        module.authorize(generate_token(), payload, verifyer, full_registry(10, 10))
+        # A retried authorize aborts the unfinished upload of the first one
+        ret = module.authorize(generate_token(), payload, verifyer, full_registry(10, 10))
+        output = json.loads(ret)
+        upload = output['filedata']['data/file1.xls']['multipart']
+        self.assertEqual([pending['UploadId'] for pending in
+                          self.s3.list_multipart_uploads(Bucket=self.bucket)['Uploads']],
+                         [upload['upload_id']])
+        self.assertEqual(upload['key'], 'owner/name/data/file1.xls')
+        self.assertEqual(len(upload['parts']), 1)
+        self.assertEqual(upload['parts'][0]['length'], 100)
+        self.assertIn('partNumber=1', upload['parts'][0]['upload_url'])
+
+        part = self.s3.upload_part(Bucket=self.bucket, Key=upload['key'], UploadId=upload['upload_id'],
+                                   PartNumber=1, Body=b'x' * 100)
+        request = {
+            'owner': 'owner',
+            'key': upload['key'],
+            'upload_id': upload['upload_id'],
+            'upload_token': upload['upload_token'],
+            'parts': [{'part_number': 1, 'etag': part['ETag']}],
+        }
+        forged = dict(request, upload_token='forged')
+        self.assertEqual(module.complete_multipart(generate_token(), forged, verifyer).status, '403 FORBIDDEN')
+        self.assertEqual(module.complete_multipart(generate_token('other'), request, verifyer).status,
+                         '401 UNAUTHORIZED')
+        out = json.loads(module.complete_multipart(generate_token(), request, verifyer))
+        self.assertEqual(out['key'], 'owner/name/data/file1.xls')
+        self.assertEqual(self.s3.head_object(Bucket=self.bucket, Key=upload['key'])['ContentLength'], 100)
+
+    @mock_s3_deprecated
+    def test___call___multipart_upload_checks_md5(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        module.config['MULTIPART_THRESHOLD'] = '50'
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        ret = module.authorize(generate_token(), PAYLOAD, verifyer, full_registry(10, 10))
+        upload = json.loads(ret)['filedata']['data/file1.xls']['multipart']
+        part = self.s3.upload_part(Bucket=self.bucket, Key=upload['key'], UploadId=upload['upload_id'],
+                                   PartNumber=1, Body=b'x' * 100)
+        out = module.complete_multipart(generate_token(), {
+            'owner': 'owner',
+            'key': upload['key'],
+            'upload_id': upload['upload_id'],
+            'upload_token': upload['upload_token'],
+            'parts': [{'part_number': 1, 'etag': part['ETag']}],
+        }, verifyer)
+        self.assertEqual(out.status, '400 BAD REQUEST')
+        self.assertNotIn('Contents', self.s3.list_objects_v2(Bucket=self.bucket))
+
+    @mock_s3_deprecated
+    def test___call___multipart_upload_abort(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        module.config['MULTIPART_THRESHOLD'] = '50'
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        ret = module.authorize(generate_token(), PAYLOAD, verifyer, full_registry(10, 10))
+        upload = json.loads(ret)['filedata']['data/file1.xls']['multipart']
+        out = json.loads(module.abort_multipart(generate_token(), {
+            'owner': 'owner',
+            'key': upload['key'],
+            'upload_id': upload['upload_id'],
+            'upload_token': upload['upload_token'],
+        }, verifyer))
+        self.assertTrue(out['aborted'])
+        self.assertNotIn('Uploads', self.s3.list_multipart_uploads(Bucket=self.bucket))
+
+    @mock_s3_deprecated
+    def test___call___dedup_skips_stored_content(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        module.config['AUTHORIZE_DEDUP'] = 'true'
+        module.config['STORAGE_PATH_PATTERN'] = '{md5_hex}{extension}'
+        content = b'hello'
+        md5 = base64.b64encode(hashlib.md5(content).digest()).decode('ascii')
+        self.s3.put_object(Bucket=self.bucket, Key=hashlib.md5(content).hexdigest() + '.xls', Body=content,
+                           ACL='public-read')
+        payload = copy.deepcopy(PAYLOAD)
+        payload['filedata']['data/file1.xls']['md5'] = md5
+        payload['filedata']['data/file2.xls'] = dict(PAYLOAD['filedata']['data/file1.xls'])
+        ret = module.authorize(generate_token(), payload,
+                                auth.lib.Verifyer(public_key=public_key),
+                                full_registry(10, 10))
+        output = json.loads(ret)
+        self.assertEqual(output['filedata']['data/file1.xls'], {'exists': True, 'upload_needed': False})
+        self.assertIn('upload_query', output['filedata']['data/file2.xls'])
+        self.assertEqual(module.dedup_stats.snapshot(), {'hits': 1, 'bytes_saved': 100, 'misses': 1})
+
+        # Stored with another ACL, the file is uploaded again to change it
+        payload['metadata']['findability'] = 'private'
+        ret = module.authorize(generate_token(), payload,
+                                auth.lib.Verifyer(public_key=public_key),
+                                full_registry(10, 10))
+        output = json.loads(ret)
+        self.assertIn('upload_query', output['filedata']['data/file1.xls'])
+        self.assertEqual(output['filedata']['data/file1.xls']['upload_query']['acl'], 'private')
+
+    @mock_s3_deprecated
+    def test___call___prefix_upload_policy(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        payload = copy.deepcopy(PAYLOAD)
+        payload['upload_mode'] = 'prefix'
+        payload['filedata']['data/file2.csv'] = dict(PAYLOAD['filedata']['data/file1.xls'], length=20,
+                                                     type='text/csv')
+        ret = module.authorize(generate_token(), payload,
+                                auth.lib.Verifyer(public_key=public_key),
+                                full_registry(10, 10))
+        output = json.loads(ret)
+        policy = output['upload_policy']
+        self.assertEqual(policy['key_prefix'], 'owner/name/')
+        self.assertEqual(policy['upload_query']['key'], 'owner/name/${filename}')
+        conditions = json.loads(base64.b64decode(policy['upload_query']['policy']).decode())['conditions']
+        self.assertIn(['starts-with', '$key', 'owner/name/'], conditions)
+        self.assertIn(['content-length-range', 20, 100], conditions)
+        self.assertIn({'acl': 'public-read'}, conditions)
+        self.assertEqual(output['filedata'], {
+            'data/file1.xls': {'key': 'owner/name/data/file1.xls', 'exists': False},
+            'data/file2.csv': {'key': 'owner/name/data/file2.csv', 'exists': False, 'type': 'text/csv'},
+        })
+
+        # not available without a dataset prefix
+        module.config['STORAGE_PATH_PATTERN'] = '{md5_hex}{extension}'
+        output = json.loads(module.authorize(generate_token(), payload,
+                                             auth.lib.Verifyer(public_key=public_key),
+                                             full_registry(10, 10)))
+        self.assertNotIn('upload_policy', output)
+        self.assertIn('upload_query', output['filedata']['data/file1.xls'])
+
+    @mock_s3_deprecated
+    def test___call___existence_index_skips_absent_keys(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        self.s3.put_object(Bucket=self.bucket, Key='owner/name/data/file1.xls', Body=b'data')
+        module.config['EXISTENCE_INDEX_RESYNC_INTERVAL'] = '0'
+        index = module.start_existence_index(self.s3)
+        payload = copy.deepcopy(PAYLOAD)
+        payload['filedata']['data/file2.xls'] = dict(PAYLOAD['filedata']['data/file1.xls'])
+        with patch.object(module.existence, 'resolve', wraps=module.existence.resolve) as resolve:
+            output = json.loads(module.authorize(generate_token(), payload,
+                                                 auth.lib.Verifyer(public_key=public_key),
+                                                 full_registry(10, 10)))
+        self.assertEqual(list(resolve.call_args[0][2]), ['owner/name/data/file1.xls'])
+        self.assertTrue(output['filedata']['data/file1.xls']['exists'])
+        self.assertFalse(output['filedata']['data/file2.xls']['exists'])
+        # keys handed out for upload are indexed
+        self.assertTrue(index.might_exist('owner/name/data/file2.xls'))
+
+    @mock_s3_deprecated
+    def test__start_existence_index__retries_failed_listing(self):
+        module.config['EXISTENCE_INDEX_RESYNC_INTERVAL'] = '3600'
+        module.config['EXISTENCE_INDEX_RETRY_INTERVAL'] = '0.01'
+        # The bucket does not exist yet
+        index = module.start_existence_index(self.s3)
+        self.addCleanup(index.stop)
+        self.assertIs(module.existence_index, index)
+        self.assertFalse(index.ready)
+        self.assertTrue(index.might_exist('owner/name/data/file1.xls'))
+        self.s3.create_bucket(Bucket=self.bucket)
+        for _ in range(500):
+            if index.ready:
+                break
+            time.sleep(0.01)
+        self.assertTrue(index.ready)
+
+    @mock_s3_deprecated
+    def test___call___records_metrics(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        self.addCleanup(setattr, module.recorder, 'enabled', module.recorder.enabled)
+        module.recorder.enabled = True
+        module.authorize(generate_token(), PAYLOAD,
+                         auth.lib.Verifyer(public_key=public_key),
+                         full_registry(10, 10))
+        text = module.metrics_text()
+        for stage in ('verify', 'quota', 'existence', 'sign'):
+            self.assertIn('bitstore_stage_seconds_count{endpoint="authorize",stage="%s"} 1' % stage, text)
+        self.assertIn('bitstore_request_seconds_count{endpoint="authorize"} 1', text)
+        self.assertIn('bitstore_s3_calls_total{operation="HeadObject"} 1', text)
+        self.assertIn('bitstore_db_queries_total{query="get_total_size_for_owner"} 1', text)
+        self.assertIn('bitstore_cache_misses_total{cache="usage"} 1', text)
+        self.assertIn('bitstore_usage_served_age_seconds{stat="max"} ', text)
+
+    def test__metrics_text__reports_most_shared_keys(self):
+        flights = patch.object(module, 'flights', module.singleflight.SingleFlight()).start()
+        release = threading.Event()
+        key = ('buckbuck', 'owner/name', 'owner')
+        threads = [threading.Thread(target=flights.do, args=('sign', key, release.wait, 5))
+                   for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            for _ in range(500):
+                if sum(flights.stats.snapshot().values()) == threads.index(thread) + 1:
+                    break
+                time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        text = module.metrics_text()
+        self.assertIn('bitstore_singleflight_shared_by_key{key="%s",step="sign"} 1' % module.flight_label(key),
+                      text)
+        self.assertNotIn('owner/name', text)
+
+    @mock_s3_deprecated
+    def test__dataset_manifest__signs_every_file_of_the_dataset(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        keys = ['owner/name/data/file%d.csv' % i for i in range(5)]
+        for key in keys + ['owner/name2/data/file.csv', 'other/name/file.csv']:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=b'hello')
+        module.config['DATASET_MANIFEST_PAGE_SIZE'] = '2'
+        module.config['STORAGE_SIGNER'] = 'native'
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        with patch.object(self.s3, 'list_objects_v2', wraps=self.s3.list_objects_v2) as listing:
+            with patch.object(module, 'get_s3_client', return_value=self.s3):
+                out = module.dataset_manifest(generate_token(), 'owner', 'name', verifyer)
+                manifest = json.loads(out.get_data(as_text=True))
+        self.assertEqual(listing.call_count, 3)
+        self.assertEqual(manifest['prefix'], 'owner/name/')
+        self.assertEqual([entry['key'] for entry in manifest['files']], keys)
+        entry = manifest['files'][0]
+        self.assertEqual(entry['size'], 5)
+        self.assertEqual(entry['etag'], hashlib.md5(b'hello').hexdigest())
+        self.assertTrue(entry['url'].startswith('https://s3.amazonaws.com/buckbuck/owner/name/data/file0.csv?'))
+        self.assertIn('X-Amz-Signature=', entry['url'])
+
+        self.assertEqual(module.dataset_manifest(generate_token('not_owner'), 'owner', 'name', verifyer).status,
+                         '401 UNAUTHORIZED')
+        self.assertEqual(module.dataset_manifest(generate_token(), 'owner', None, verifyer).status,
+                         '400 BAD REQUEST')
+        out = module.dataset_manifest(generate_token(), 'owner', 'empty', verifyer)
+        self.assertEqual(json.loads(out.get_data(as_text=True)), {'prefix': 'owner/empty/', 'files': []})
+
+    @mock_s3_deprecated
+    def test___call___throttled(self):
+        self.s3.create_bucket(Bucket=self.bucket)
+        patch.object(module, 'admission_control', module.admission.AdmissionControl({
+            'authorize': module.admission.Policy(rate=1, burst=2)
+        })).start()
+        payload = copy.deepcopy(PAYLOAD)
+        payload['filedata']['data/file2.xls'] = dict(PAYLOAD['filedata']['data/file1.xls'])
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        ret = module.authorize(generate_token(), payload, verifyer, full_registry(10, 10))
+        self.assertIs(type(ret), str)
+        out = module.authorize(generate_token(), payload, verifyer, full_registry(10, 10))
+        self.assertEqual(out.status, '429 TOO MANY REQUESTS')
+        self.assertEqual(out.headers['Retry-After'], '2')
+        self.assertIn('bitstore_admission_requests_total{endpoint="authorize",outcome="throttled"} 1',
+                      module.metrics_text())
+
+    @requests_mock.mock()
+    def test__presign__throttles_anonymous_callers_by_address(self, m):
+        patch.object(module, 'admission_control', module.admission.AdmissionControl({
+            'presign': module.admission.Policy(rate=1, burst=1)
+        })).start()
+        url = 'http://test.com'
+        m.head(url, status_code=200)
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        app = Flask(__name__)
+
+        def presign(address):
+            self.request.remote_addr = address
+            with app.test_request_context():
+                return module.presign(None, url, verifyer)
+
+        self.assertEqual(json.loads(presign('10.0.0.1'))['url'], url)
+        self.assertEqual(presign('10.0.0.1').status, '429 TOO MANY REQUESTS')
+        self.assertEqual(json.loads(presign('10.0.0.2'))['url'], url)
+
+    @mock_s3_deprecated
+    @requests_mock.mock()
+    def test___call___sharded_storage(self, m):
+        module.config['STORAGE_SHARDS'] = 'shard-a,shard-b'
+        for bucket in [self.bucket, 'shard-a', 'shard-b']:
+            self.s3.create_bucket(Bucket=bucket)
+        payload = copy.deepcopy(PAYLOAD)
+        for i in range(20):
+            payload['filedata']['data/file%d.csv' % i] = dict(PAYLOAD['filedata']['data/file1.xls'])
+        # Written before sharding
+        self.s3.put_object(Bucket=self.bucket, Key='owner/name/data/file1.xls', Body=b'old')
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        output = json.loads(module.authorize(generate_token(), payload, verifyer, full_registry(10, 10)))
+
+        buckets = set()
+        for path, entry in output['filedata'].items():
+            key = 'owner/name/' + path
+            bucket = module.get_ring().get(key).bucket
+            buckets.add(bucket)
+            self.assertEqual(entry['upload_url'], 'https://s3.amazonaws.com/' + bucket)
+            self.assertEqual(entry['exists'], path == 'data/file1.xls')
+        self.assertEqual(buckets, {'shard-a', 'shard-b'})
+
+        prefixes = json.loads(module.info(generate_token('12345678'), verifyer))['prefixes']
+        self.assertIn('https://shard-a/12345678', prefixes)
+        self.assertIn('https://buckbuck/12345678', prefixes)
+
+        # Legacy URLs are signed for the shard once the key is written there
+        key = 'owner/name/data/file1.xls'
+        shard = module.get_ring().get(key).bucket
+        url = 'http://buckbuck/' + key
+        m.head(url, status_code=403)
+        out = json.loads(module.presign(generate_token(), url, verifyer, 'owner'))
+        self.assertTrue(out['url'].startswith('https://s3.amazonaws.com/buckbuck/' + key))
+        self.s3.put_object(Bucket=shard, Key=key, Body=b'new')
+        module.presign_cache.invalidate()
+        out = json.loads(module.presign(generate_token(), url, verifyer, 'owner'))
+        self.assertTrue(out['url'].startswith('https://s3.amazonaws.com/%s/%s' % (shard, key)))
+
+    def test__get_s3_client__reuses_pooled_client(self):
+        client = module.get_s3_client()
+        self.assertIs(module.get_s3_client(), client)
+        module.reset_state()
+        self.assertIsNot(module.get_s3_client(), client)
+
     def test___info___not_authorized(self):
         info = module.info
         self.assertEqual(
@@ -216,6 +594,25 @@ class DataStoreTest(unittest.TestCase):
                               'https://buckbuck:443/12345678',
                               'https://buckbuck/12345678'])
 
+    def test___info___conditional_response(self):
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        out = module.info_response(generate_token('12345678'), verifyer)
+        self.assertEqual(out.status_code, 200)
+        self.assertEqual(json.loads(out.get_data(as_text=True)),
+                         json.loads(module.info(generate_token('12345678'), verifyer)))
+        etag = out.headers['ETag']
+        self.assertIn('max-age=', out.headers['Cache-Control'])
+
+        out = module.info_response(generate_token('12345678'), verifyer, etag)
+        self.assertEqual(out.status_code, 304)
+        self.assertEqual(out.headers['ETag'], etag)
+        self.assertEqual(out.get_data(), b'')
+
+        out = module.info_response(generate_token('other'), verifyer, etag)
+        self.assertEqual(out.status_code, 200)
+        self.assertNotEqual(out.headers['ETag'], etag)
+        self.assertEqual(module.info_response('not_owner', verifyer, etag).status_code, 401)
+
     @requests_mock.mock()
     def test__checkurl__returns_url_as_is_if_not_forbidden(self, m):
         presign = module.presign
@@ -257,6 +654,92 @@ class DataStoreTest(unittest.TestCase):
         self.assertTrue(out['url'].startswith('https://s3.amazonaws.com/buckbuck/owner/name'))
         self.assertTrue('Expires=86400' in out['url'])
 
+    @requests_mock.mock()
+    def test__checkurl__signes_url_with_native_signer(self, m):
+        module.config['STORAGE_SIGNER'] = 'native'
+        presign = module.presign
+        url = 'http://{}/{}/{}'.format(module.config['STORAGE_BUCKET_NAME'], 'owner', 'name')
+        m.head(url, status_code=403)
+        out = json.loads(presign(generate_token(), url, auth.lib.Verifyer(public_key=public_key), 'owner'))
+        self.assertTrue(out['url'].startswith('https://s3.amazonaws.com/buckbuck/owner/name'))
+        self.assertTrue('Expires=86400' in out['url'])
+
+    @requests_mock.mock()
+    def test__checkurl__reuses_cached_signed_url(self, m):
+        presign = module.presign
+        url = 'http://{}/{}/{}'.format(module.config['STORAGE_BUCKET_NAME'], 'owner', 'name')
+        m.head(url, status_code=403)
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        first = json.loads(presign(generate_token(), url, verifyer, 'owner'))
+        second = json.loads(presign(generate_token(), url, verifyer, 'owner'))
+        self.assertEqual(first, second)
+        self.assertEqual(module.presign_cache.stats()['hits'], 1)
+        module.invalidate_presigned_urls('buckbuck', 'owner/name')
+        self.assertEqual(len(module.presign_cache), 0)
+
+    @requests_mock.mock()
+    def test__checkurl__caches_probe_outcome(self, m):
+        presign = module.presign
+        url = 'http://test.com'
+        m.head(url, status_code=200)
+        verifyer = auth.lib.Verifyer(public_key=public_key)
+        presign(generate_token(), url, verifyer, 'owner')
+        out = json.loads(presign(generate_token(), url, verifyer, 'owner'))
+        self.assertEqual(out['url'], 'http://test.com')
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.mock()
+    def test__checkurl__skips_probe_for_private_bucket(self, m):
+        module.config['PRESIGN_SKIP_PROBE_FOR_PRIVATE_BUCKET'] = 'true'
+        presign = module.presign
+        url = 'http://{}/{}/{}'.format(module.config['STORAGE_BUCKET_NAME'], 'owner', 'name')
+        out = json.loads(presign(generate_token(), url, auth.lib.Verifyer(public_key=public_key), 'owner'))
+        self.assertTrue(out['url'].startswith('https://s3.amazonaws.com/buckbuck/owner/name'))
+        self.assertEqual(m.call_count, 0)
+
+        # Other callers are probed, and get public files as is
+        m.head(url, status_code=200)
+        out = json.loads(presign(None, url, auth.lib.Verifyer(public_key=public_key)))
+        self.assertEqual(out['url'], url)
+        out = json.loads(presign(generate_token('other'), url, auth.lib.Verifyer(public_key=public_key),
+                                 'owner'))
+        self.assertEqual(out['url'], url)
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.mock()
+    def test__checkurl__bulk(self, m):
+        private = 'http://{}/{}/{}'.format(module.config['STORAGE_BUCKET_NAME'], 'owner', 'name')
+        foreign = 'http://{}/{}/{}'.format('pkgstore', 'other', 'name')
+        public = 'http://test.com'
+        m.head(private, status_code=403)
+        m.head(foreign, status_code=403)
+        m.head(public, status_code=200)
+        module.config['PRESIGN_BULK_POOL_SIZE'] = '0'
+        out = json.loads(module.presign_bulk(generate_token(), {'urls': [
+            {'url': private, 'ownerid': 'owner'},
+            {'url': foreign, 'ownerid': 'owner'},
+            {'url': public},
+        ]}, auth.lib.Verifyer(public_key=public_key)))
+        self.assertEqual(out['urls'][private]['status'], 200)
+        self.assertTrue(out['urls'][private]['url'].startswith('https://s3.amazonaws.com/buckbuck/owner/name'))
+        self.assertEqual(out['urls'][foreign], {'status': 403})
+        self.assertEqual(out['urls'][public], {'status': 200, 'url': public})
+
+        # Same results on the presign pool, used by default
+        del module.config['PRESIGN_BULK_POOL_SIZE']
+        module.presign_cache.invalidate()
+        with patch.object(module.parallel.WorkerPool, 'imap', autospec=True,
+                          side_effect=module.parallel.WorkerPool.imap) as imap:
+            pooled = json.loads(module.presign_bulk(generate_token(), {'urls': [
+                {'url': private, 'ownerid': 'owner'},
+                {'url': foreign, 'ownerid': 'owner'},
+                {'url': public},
+            ]}, auth.lib.Verifyer(public_key=public_key)))
+        self.assertEqual(imap.call_count, 1)
+        self.assertEqual(dict((url, result['status']) for url, result in pooled['urls'].items()),
+                         {private: 200, foreign: 403, public: 200})
+        self.assertTrue(pooled['urls'][private]['url'].startswith('https://s3.amazonaws.com/buckbuck/owner/name'))
+
     @requests_mock.mock()
     def test__checkurl__handles_path_style_urls(self, m):
         presign = module.presign
@@ -0,0 +1,68 @@
+import unittest
+
+from moto import mock_s3_deprecated
+import boto3
+
+from importlib import import_module
+module = import_module('bitstore.existence')
+
+
+class ExistenceTest(unittest.TestCase):
+
+    bucket = 'buckbuck'
+
+    # Helpers
+
+    def make_bucket(self, *keys):
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=self.bucket)
+        for key in keys:
+            s3.put_object(Bucket=self.bucket, Key=key, Body=b'data')
+        return s3
+
+    # Tests
+
+    def test__plan__lists_directories_and_heads_the_rest(self):
+        listings, heads = module.plan([
+            'owner/name/data/a.csv',
+            'owner/name/data/b.csv',
+            'owner/name/data/c.csv',
+            'owner/name/README.md',
+            '044e18f0bf3b19ac0428a75c85436194.xls',
+        ])
+        self.assertEqual(listings, [('owner/name/data/', [
+            'owner/name/data/a.csv',
+            'owner/name/data/b.csv',
+            'owner/name/data/c.csv',
+        ])])
+        self.assertEqual(heads, [
+            'owner/name/README.md',
+            '044e18f0bf3b19ac0428a75c85436194.xls',
+        ])
+
+    @mock_s3_deprecated
+    def test__resolve__with_listing_is_exact_for_prefix_keys(self):
+        s3 = self.make_bucket('owner/name/file.csv', 'owner/name/file.csv.gz')
+        keys = ['owner/name/file', 'owner/name/file.csv', 'owner/name/file.csv.gz']
+        found = module.resolve(s3, self.bucket, keys, list_threshold=1)
+        self.assertIsNone(found['owner/name/file'])
+        self.assertEqual(found['owner/name/file.csv']['Size'], 4)
+        self.assertEqual(found['owner/name/file.csv.gz']['Size'], 4)
+
+    @mock_s3_deprecated
+    def test__resolve__with_head_is_exact_for_prefix_keys(self):
+        s3 = self.make_bucket('owner/name/file.csv.gz')
+        keys = ['owner/name/file.csv', 'owner/name/file.csv.gz']
+        found = module.resolve(s3, self.bucket, keys, list_threshold=100)
+        self.assertIsNone(found['owner/name/file.csv'])
+        self.assertTrue(found['owner/name/file.csv.gz']['ETag'])
+
+    @mock_s3_deprecated
+    def test__resolve__falls_back_to_head_when_listing_is_cut_short(self):
+        s3 = self.make_bucket(*['owner/name/%04d' % i for i in range(5)])
+        keys = ['owner/name/0000', 'owner/name/0004', 'owner/name/0009']
+        found = module.resolve(s3, self.bucket, keys,
+                               list_threshold=1, max_list_pages=0)
+        self.assertTrue(found['owner/name/0000'])
+        self.assertTrue(found['owner/name/0004'])
+        self.assertIsNone(found['owner/name/0009'])
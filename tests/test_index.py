@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+from moto import mock_s3_deprecated
+import boto3
+
+from importlib import import_module
+module = import_module('bitstore.index')
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    # Tests
+
+    def test__bloom_filter__has_no_false_negatives(self):
+        bloom = module.BloomFilter(1000, 0.01)
+        keys = ['owner/name/file%d.csv' % i for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertEqual(bloom.count, 1000)
+
+    def test__bloom_filter__false_positive_rate_within_bounds(self):
+        bloom = module.BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('present/%d' % i)
+        false_positives = sum('absent/%d' % i in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000.0, 0.03)
+        self.assertAlmostEqual(bloom.false_positive_rate, 0.01, delta=0.005)
+        self.assertEqual(bloom.memory_bytes, (bloom.size + 7) // 8)
+
+
+class ExistenceIndexTest(unittest.TestCase):
+
+    bucket = 'buckbuck'
+
+    # Helpers
+
+    def make_bucket(self, *keys):
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=self.bucket)
+        for key in keys:
+            s3.put_object(Bucket=self.bucket, Key=key, Body=b'data')
+        return s3
+
+    # Tests
+
+    def test__might_exist__true_until_synced(self):
+        index = module.ExistenceIndex(capacity=100)
+        self.assertTrue(index.might_exist('owner/name/a.csv'))
+
+    @mock_s3_deprecated
+    def test__sync__indexes_bucket_listing(self):
+        s3 = self.make_bucket('owner/name/a.csv', 'owner/name/b.csv')
+        index = module.ExistenceIndex(capacity=100)
+        index.sync(s3, self.bucket)
+        self.assertTrue(index.might_exist('owner/name/a.csv'))
+        self.assertTrue(index.might_exist('owner/name/b.csv'))
+        self.assertFalse(index.might_exist('owner/name/c.csv'))
+        index.add('owner/name/c.csv')
+        self.assertTrue(index.might_exist('owner/name/c.csv'))
+        stats = index.stats()
+        self.assertEqual(stats['keys'], 3)
+        self.assertTrue(stats['ready'])
+
+    @mock_s3_deprecated
+    def test__save__roundtrips_snapshot(self):
+        s3 = self.make_bucket('owner/name/a.csv')
+        index = module.ExistenceIndex(capacity=100)
+        index.sync(s3, self.bucket)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'index.bin')
+        index.save(path)
+
+        loaded = module.ExistenceIndex()
+        loaded.load(path)
+        self.assertTrue(loaded.might_exist('owner/name/a.csv'))
+        self.assertFalse(loaded.might_exist('owner/name/b.csv'))
+        self.assertEqual(loaded.stats()['keys'], 1)
+        self.assertEqual(loaded.synced_at, index.synced_at)
+
+    @mock_s3_deprecated
+    def test__refresh__shares_the_index_through_the_snapshot(self):
+        s3 = self.make_bucket('owner/name/a.csv')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'index.bin')
+        first = module.ExistenceIndex(capacity=100, snapshot_path=path)
+        second = module.ExistenceIndex(capacity=100, snapshot_path=path)
+        first.refresh(s3, self.bucket, 3600)
+        # The fresh snapshot is loaded rather than listing the bucket again
+        listing = Mock(side_effect=Exception('listed twice'))
+        second.refresh(Mock(get_paginator=listing), self.bucket, 3600)
+        self.assertTrue(second.might_exist('owner/name/a.csv'))
+        self.assertFalse(second.might_exist('owner/name/b.csv'))
+
+        # Keys reported to one process are seen by the other
+        first.add_keys(['owner/name/b.csv'])
+        second.catch_up()
+        self.assertTrue(second.might_exist('owner/name/b.csv'))
+
+        # and survive a resync, whose snapshot the other process loads
+        second.refresh(s3, self.bucket, 0)
+        second.add_keys(['owner/name/c.csv'])
+        first.catch_up()
+        self.assertEqual(first.synced_at, second.synced_at)
+        for key in ['owner/name/a.csv', 'owner/name/b.csv', 'owner/name/c.csv']:
+            self.assertTrue(first.might_exist(key))
+        self.assertFalse(first.might_exist('owner/name/d.csv'))
+
+    def test__stats__observed_false_positive_rate(self):
+        index = module.ExistenceIndex(capacity=100)
+        index.record(4, 3)
+        self.assertEqual(index.stats()['observed_false_positive_rate'], 0.25)
@@ -0,0 +1,70 @@
+import io
+import json
+import unittest
+
+from importlib import import_module
+module = import_module('bitstore.ingest')
+
+MD5 = 'BE4Y8L87GawEKKdchUNhlA=='
+PAYLOAD = {
+    'metadata': {'owner': 'owner', 'dataset': 'name'},
+    'filedata': dict(
+        ('data/file%d.csv' % i, {'length': i, 'md5': MD5, 'type': 'text/csv'})
+        for i in range(100)
+    ),
+}
+
+
+def read(payload, max_bytes=1000000, max_files=1000, **kwargs):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+    return module.read_manifest(io.BytesIO(body), max_bytes, max_files, **kwargs)
+
+
+class ReadManifestTest(unittest.TestCase):
+
+    def test__read_manifest__parses_like_json(self):
+        for chunk_size in [1, 10, 64 * 1024]:
+            manifest = read(PAYLOAD, chunk_size=chunk_size)
+            self.assertEqual(manifest.get('metadata'), PAYLOAD['metadata'])
+            self.assertEqual(len(manifest['filedata']), 100)
+            self.assertEqual(manifest['filedata'].total_bytes, sum(range(100)))
+            self.assertEqual(dict(manifest['filedata'].items()), PAYLOAD['filedata'])
+            self.assertEqual(list(manifest['filedata'].items())[0][0], 'data/file0.csv')
+
+    def test__read_manifest__enforces_limits(self):
+        with self.assertRaises(module.ManifestTooLarge):
+            read(PAYLOAD, max_bytes=100)
+        with self.assertRaises(module.ManifestTooLarge):
+            read(PAYLOAD, content_length=10 ** 9)
+        with self.assertRaises(module.ManifestTooLarge):
+            read(PAYLOAD, max_files=99)
+
+    def test__read_manifest__validates_entries(self):
+        for file in [{'md5': MD5},
+                     {'length': -1, 'md5': MD5},
+                     {'length': '1', 'md5': MD5},
+                     {'length': 1, 'md5': 'not-an-md5'},
+                     {'length': 1, 'md5': MD5, 'type': 1},
+                     'file']:
+            with self.assertRaises(module.ManifestError):
+                read({'filedata': {'a.csv': file}})
+
+    def test__read_manifest__rejects_malformed_bodies(self):
+        for body in [b'', b'[]', b'{"a": 1', b'{"a": 1} 2', b'{"a" 1}', b'{"a": 1,}', b'\xff']:
+            with self.assertRaises(module.ManifestError):
+                read(body, chunk_size=3)
+
+    def test__read_manifest__requires_filedata(self):
+        for payload in [{}, {'metadata': {'owner': 'owner'}}]:
+            with self.assertRaises(module.ManifestError):
+                read(payload)
+        self.assertEqual(len(read({'filedata': {}})['filedata']), 0)
+
+    def test__read_manifest__keeps_the_last_duplicate_path(self):
+        body = ('{"filedata": {"a.csv": {"length": 5, "md5": "%s"}, '
+                '"b.csv": {"length": 1, "md5": "%s"}, '
+                '"a.csv": {"length": 7, "md5": "%s"}}}' % (MD5, MD5, MD5)).encode('utf-8')
+        filedata = read(body, max_files=2)['filedata']
+        self.assertEqual(list(filedata), ['a.csv', 'b.csv'])
+        self.assertEqual(filedata['a.csv']['length'], 7)
+        self.assertEqual(filedata.total_bytes, 8)
@@ -0,0 +1,73 @@
+import unittest
+
+from importlib import import_module
+module = import_module('bitstore.metrics')
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.recorder = module.Recorder(enabled=True, buckets=(0.01, 0.1), clock=self.clock)
+
+    # Helpers
+
+    def handle(self):
+        with self.recorder.timer('authorize', 'verify'):
+            self.clock.now += 0.005
+        with self.recorder.timer('authorize', 'sign'):
+            self.clock.now += 0.05
+        return 'done'
+
+    # Tests
+
+    def test__timed__records_request_and_stages(self):
+        handle = self.recorder.timed('authorize')(self.handle)
+        self.assertEqual(handle(), 'done')
+        text = self.recorder.render()
+        self.assertIn('# TYPE bitstore_stage_seconds histogram', text)
+        self.assertIn('bitstore_stage_seconds_bucket{endpoint="authorize",stage="verify",le="0.01"} 1', text)
+        self.assertIn('bitstore_stage_seconds_bucket{endpoint="authorize",stage="sign",le="0.01"} 0', text)
+        self.assertIn('bitstore_stage_seconds_bucket{endpoint="authorize",stage="sign",le="+Inf"} 1', text)
+        self.assertIn('bitstore_request_seconds_count{endpoint="authorize"} 1', text)
+        self.assertIn('bitstore_request_seconds_bucket{endpoint="authorize",le="0.1"} 1', text)
+
+    def test__timed__records_nothing_when_disabled(self):
+        self.recorder.enabled = False
+        self.recorder.timed('authorize')(self.handle)()
+        self.recorder.inc('bitstore_s3_calls_total', operation='HeadObject')
+        self.assertEqual(self.recorder.render(), '\n')
+
+    def test__timed__logs_sampled_requests(self):
+        self.recorder.sample_rate = 1
+        with self.assertLogs(level='INFO') as logs:
+            self.recorder.timed('authorize')(self.handle)()
+        self.assertEqual(logs.output, ['INFO:root:authorize took 55.0ms (verify=5.0ms, sign=50.0ms)'])
+
+    def test__render__includes_counters_and_samples(self):
+        self.recorder.inc('bitstore_s3_calls_total', operation='HeadObject')
+        self.recorder.inc('bitstore_s3_calls_total', 2, operation='HeadObject')
+        text = self.recorder.render([('bitstore_cache_hits_total', 'counter', {'cache': 'presign'}, 4)])
+        self.assertEqual(text.splitlines(), [
+            '# TYPE bitstore_s3_calls_total counter',
+            'bitstore_s3_calls_total{operation="HeadObject"} 3',
+            '# TYPE bitstore_cache_hits_total counter',
+            'bitstore_cache_hits_total{cache="presign"} 4',
+        ])
+
+    def test__render__escapes_label_values(self):
+        text = self.recorder.render([('bitstore_presign_total', 'counter',
+                                      {'url': 'a"b\\c\nbitstore_fake 1'}, 1)])
+        self.assertEqual(text.splitlines(), [
+            '# TYPE bitstore_presign_total counter',
+            'bitstore_presign_total{url="a\\"b\\\\c\\nbitstore_fake 1"} 1',
+        ])
@@ -0,0 +1,28 @@
+import unittest
+
+from importlib import import_module
+module = import_module('bitstore.multipart')
+
+MB = 1024 * 1024
+
+
+class MultipartTest(unittest.TestCase):
+
+    def test__plan_parts__splits_file(self):
+        self.assertEqual(module.plan_parts(12 * MB, 5 * MB), [
+            (1, 0, 5 * MB),
+            (2, 5 * MB, 5 * MB),
+            (3, 10 * MB, 2 * MB),
+        ])
+
+    def test__plan_parts__respects_s3_limits(self):
+        self.assertEqual(module.plan_parts(100, 10), [(1, 0, 100)])
+        parts = module.plan_parts(100000 * MB, 5 * MB)
+        self.assertEqual(len(parts), 10000)
+        self.assertEqual(sum(length for _, _, length in parts), 100000 * MB)
+
+    def test__upload_token__is_bound_to_owner(self):
+        token = module.upload_token('secret', 'bucket', 'key', 'upload', 'owner')
+        self.assertTrue(module.check_upload_token('secret', 'bucket', 'key', 'upload', 'owner', token))
+        self.assertFalse(module.check_upload_token('secret', 'bucket', 'key', 'upload', 'other', token))
+        self.assertFalse(module.check_upload_token('secret', 'bucket', 'key', 'upload', 'owner', None))
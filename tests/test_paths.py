@@ -0,0 +1,54 @@
+import unittest
+
+from importlib import import_module
+module = import_module('bitstore.paths')
+
+FILE = {
+    'name': 'file1.xls',
+    'length': 100,
+    'md5': 'BE4Y8L87GawEKKdchUNhlA==',
+}
+
+
+class PathPatternTest(unittest.TestCase):
+
+    def format(self, pattern, file=FILE, path='data/file1.xls'):
+        return module.compile_pattern(pattern).format(file, 'owner', 'name', path)
+
+    def test__format__fields(self):
+        self.assertEqual(self.format('{owner}/{dataset}/{path}'), 'owner/name/data/file1.xls')
+        self.assertEqual(self.format('{dirname}/{basename}|{extension}|{name}'),
+                         'data/file1.xls|.xls|file1.xls')
+        self.assertEqual(self.format('{md5_hex}{extension}'), '044e18f0bf3b19ac0428a75c85436194.xls')
+        self.assertEqual(self.format('{md5}'), 'BE4Y8L87GawEKKdchUNhlA==')
+
+    def test__fields__lists_referenced_fields(self):
+        self.assertEqual(module.compile_pattern('x/{owner}/{md5_hex:.2}/{md5_hex}').fields,
+                         ['owner', 'md5_hex'])
+
+    def test__format__missing_field(self):
+        with self.assertRaises(ValueError) as cm:
+            self.format('{owner}/{md5_hex}', file={'length': 1})
+        self.assertIn("'md5_hex'", str(cm.exception))
+        with self.assertRaises(ValueError):
+            self.format('{owner}/{title}')
+
+    def test__compile__rejects_invalid_patterns(self):
+        for pattern in ['{owner', '{}/{path}', '{0}', '{path!x}', '{path:d}', '{length:s}',
+                        '{path.nope}', '{owner[99]}']:
+            with self.assertRaises(ValueError):
+                module.PathPattern(pattern)
+
+    def test__compile__accepts_indexing_and_format_specs(self):
+        self.assertEqual(self.format('{md5_hex[0]}{md5_hex[1]}/{md5_hex}'),
+                         '04/044e18f0bf3b19ac0428a75c85436194')
+        self.assertEqual(self.format('{owner}/{length:012d}'), 'owner/000000000100')
+
+    def test__dataset_prefix(self):
+        self.assertEqual(module.compile_pattern('{owner}/{dataset}/{path}').dataset_prefix('owner', 'name'),
+                         'owner/name/')
+        self.assertEqual(module.compile_pattern('x/{owner}/{dataset}/{dirname}/{md5}').dataset_prefix('o', 'n'),
+                         'x/o/n/')
+        self.assertIsNone(module.compile_pattern('{owner}/{dataset}-{path}').dataset_prefix('owner', 'name'))
+        self.assertIsNone(module.compile_pattern('{owner}/{path}').dataset_prefix('owner', 'name'))
+        self.assertIsNone(module.compile_pattern('{md5_hex}{extension}').dataset_prefix('owner', 'name'))
@@ -0,0 +1,40 @@
+import collections
+import unittest
+
+from bitstore import shards
+
+KEYS = ['owner/dataset%d/data/file%d.csv' % (i % 50, i) for i in range(5000)]
+
+
+class HashRingTest(unittest.TestCase):
+
+    def test__get__spreads_keys_over_all_shards(self):
+        ring = shards.HashRing(shards.parse_shards('a,b,c,d'))
+        counts = collections.Counter(ring.get(key).bucket for key in KEYS)
+        self.assertEqual(set(counts), {'a', 'b', 'c', 'd'})
+        for count in counts.values():
+            self.assertGreater(count, len(KEYS) / 4 * 0.7)
+            self.assertLess(count, len(KEYS) / 4 * 1.3)
+
+    def test__get__is_stable(self):
+        first = shards.HashRing(shards.parse_shards('a,b,c'))
+        second = shards.HashRing(shards.parse_shards('c,a,b'))
+        self.assertEqual([first.get(key) for key in KEYS], [second.get(key) for key in KEYS])
+
+    def test__get__adding_a_shard_only_moves_keys_to_it(self):
+        before = shards.HashRing(shards.parse_shards('a,b,c,d'))
+        after = shards.HashRing(shards.parse_shards('a,b,c,d,e'))
+        moved = [key for key in KEYS if before.get(key) != after.get(key)]
+        self.assertTrue(all(after.get(key).bucket == 'e' for key in moved))
+        self.assertLess(len(moved), len(KEYS) / 5 * 1.3)
+
+    def test__parse_shards__with_endpoints(self):
+        parsed = shards.parse_shards(' a, http://minio-2:9000/b/ ,')
+        self.assertEqual([(shard.bucket, shard.endpoint_url) for shard in parsed],
+                         [('a', None), ('b', 'http://minio-2:9000')])
+        self.assertEqual(shards.parse_shards(''), [])
+        self.assertIsNone(shards.get_ring(''))
+        with self.assertRaises(ValueError):
+            shards.parse_shards('a,http://minio-2:9000/a')
+        with self.assertRaises(ValueError):
+            shards.parse_shards('http://minio-2:9000')
@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+from importlib import import_module
+module = import_module('bitstore.singleflight')
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = module.SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    # Helpers
+
+    def work(self, value):
+        self.calls.append(value)
+        self.release.wait(5)
+        if isinstance(value, Exception):
+            raise value
+        return value * 2
+
+    def run_concurrently(self, key, value, count=4):
+        results = [None] * count
+
+        def run(i):
+            try:
+                results[i] = self.flights.do('work', key, self.work, value)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        # Let every caller join the in-flight call before releasing it
+        deadline = time.time() + 5
+        while self.flights.stats.get('work.shared') < count - 1 and time.time() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    # Tests
+
+    def test__do__shares_in_flight_call(self):
+        self.assertEqual(self.run_concurrently('a', 21), [42] * 4)
+        self.assertEqual(self.calls, [21])
+        self.assertEqual(self.flights.stats.snapshot(), {'work.executed': 1, 'work.shared': 3})
+        self.assertEqual(self.flights.saved(), [('work', 'a', 3)])
+
+    def test__do__shares_exceptions(self):
+        error = ValueError('boom')
+        self.assertEqual(self.run_concurrently('a', error), [error] * 4)
+        self.assertEqual(self.calls, [error])
+
+    def test__do__does_not_cache_results(self):
+        self.release.set()
+        self.assertEqual(self.flights.do('work', 'a', self.work, 1), 2)
+        self.assertEqual(self.flights.do('work', 'a', self.work, 2), 4)
+        self.assertEqual(self.calls, [1, 2])
+        self.assertEqual(self.flights.saved(), [])
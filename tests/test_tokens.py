@@ -0,0 +1,62 @@
+import time
+import unittest
+
+import jwt
+import requests_mock
+
+import auth
+from importlib import import_module
+module = import_module('bitstore.tokens')
+
+private_key = open('tests/private.pem').read()
+public_key = open('tests/public.pem').read()
+
+
+def generate_token(userid='owner', **claims):
+    claims['userid'] = userid
+    return jwt.encode(claims, private_key, algorithm='RS256').decode('ascii')
+
+
+class CountingVerifyer(auth.lib.Verifyer):
+
+    calls = 0
+
+    def extract_permissions(self, auth_token):
+        CountingVerifyer.calls += 1
+        return super(CountingVerifyer, self).extract_permissions(auth_token)
+
+
+class CachingVerifyerTest(unittest.TestCase):
+
+    def setUp(self):
+        CountingVerifyer.calls = 0
+        self.verifyer = module.CachingVerifyer(CountingVerifyer(public_key=public_key))
+
+    def test__extract_permissions__verifies_token_once(self):
+        token = generate_token()
+        self.assertEqual(self.verifyer.extract_permissions(token)['userid'], 'owner')
+        self.assertEqual(self.verifyer.extract_permissions(token)['userid'], 'owner')
+        self.assertEqual(CountingVerifyer.calls, 1)
+
+    def test__extract_permissions__does_not_cache_past_expiry(self):
+        token = generate_token(exp=int(time.time()) - 1)
+        self.verifyer.extract_permissions(token)
+        self.verifyer.extract_permissions(token)
+        self.assertEqual(CountingVerifyer.calls, 2)
+
+    def test__extract_permissions__does_not_cache_invalid_tokens(self):
+        self.assertFalse(self.verifyer.extract_permissions('not-a-token'))
+        self.assertFalse(self.verifyer.extract_permissions('not-a-token'))
+        self.assertEqual(CountingVerifyer.calls, 2)
+
+    @requests_mock.mock()
+    def test__refresh_public_key__drops_cache_when_key_changes(self, m):
+        m.get('http://auth/auth/public-key', text=public_key)
+        self.verifyer.auth_endpoint = 'http://auth/auth/public-key'
+        token = generate_token()
+        self.verifyer.extract_permissions(token)
+        self.verifyer.refresh_public_key()
+        self.assertEqual(len(self.verifyer.cache), 0)
+        self.assertEqual(self.verifyer.extract_permissions(token)['userid'], 'owner')
+        self.verifyer.refresh_public_key()
+        self.assertEqual(len(self.verifyer.cache), 1)
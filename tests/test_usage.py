@@ -0,0 +1,59 @@
+import unittest
+
+from importlib import import_module
+module = import_module('bitstore.usage')
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.totals = {}
+        self.queries = 0
+
+    def get_total_size_for_owner(self, owner, findability=None):
+        self.queries += 1
+        return self.totals.get((owner, findability), 0)
+
+
+class UsageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.registry = Registry()
+        self.usage = module.UsageCache(ttl=10, clock=self.clock)
+
+    def test__get_total_size__reuses_totals_within_ttl(self):
+        self.registry.totals[('owner', 'private')] = 100
+        self.assertEqual(self.usage.get_total_size(self.registry, 'owner', 'private'), 100)
+        self.registry.totals[('owner', 'private')] = 200
+        self.clock.now = 4
+        self.assertEqual(self.usage.get_total_size(self.registry, 'owner', 'private'), 100)
+        self.assertEqual(self.registry.queries, 1)
+        self.clock.now = 10
+        self.assertEqual(self.usage.get_total_size(self.registry, 'owner', 'private'), 200)
+        self.assertEqual(self.registry.queries, 2)
+        stats = self.usage.stats()
+        self.assertEqual(stats['served'], 3)
+        self.assertEqual(stats['served_age_max'], 4)
+        # The max only covers recent requests
+        self.clock.now = 70
+        self.assertEqual(self.usage.stats()['served_age_max'], 4)
+        self.clock.now = 130
+        self.assertEqual(self.usage.stats()['served_age_max'], 0)
+
+    def test__invalidate__forces_a_query(self):
+        self.usage.get_total_size(self.registry, 'owner')
+        self.usage.get_total_size(self.registry, 'other')
+        self.usage.invalidate('owner')
+        self.usage.get_total_size(self.registry, 'owner')
+        self.usage.get_total_size(self.registry, 'other')
+        self.assertEqual(self.registry.queries, 3)